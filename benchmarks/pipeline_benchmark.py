@@ -0,0 +1,405 @@
+"""
+Benchmarks every training pipeline stage on synthetic data, without Postgres, Redis or ICARUS.
+
+The organizations, data assets, Aviation Data Model categories and interactions are generated at the requested sizes and
+served by in-process substitutes of Redis, Postgres and the ICARUS HTTP API; the stages then run one after the other as
+in src/pipeline.py, writing their files to a temporary directory, and the wall time and peak memory of each is reported.
+
+    python benchmarks/pipeline_benchmark.py --orgs 1000 --assets 50000 --interactions 200000
+
+Peak memory is measured with tracemalloc, which slows the stages down; --no-memory reports undisturbed wall times.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import fnmatch
+import functools
+import logging
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from types import SimpleNamespace
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+# read by the stages, on import or when they run
+os.environ["icarus_internal"] = "icarus.benchmark/"
+os.environ.setdefault("interaction_table", "interactions")
+os.environ.setdefault("interaction_watermark_column", "id")
+
+import http_client
+import pipeline
+import generations
+import hybrid_recommendations
+import recommendation_store
+from models_training import retrieve_data
+from models_training import interaction_store
+from models_training import item_based_model
+from models_training import user_based_model
+from models_scoring import semantic_scoring
+from models_scoring import item_based_scoring
+from models_scoring import user_based_scoring
+
+logger = logging.getLogger(__name__)
+
+STAGE_MODULES = (retrieve_data, interaction_store, item_based_model, user_based_model, semantic_scoring,
+                 item_based_scoring, user_based_scoring, hybrid_recommendations, recommendation_store)
+
+
+###########################################################
+class FakeRedis:
+    """
+    The subset of the redis.Redis client the pipeline uses, over a dictionary; values are kept as bytes, as Redis returns them.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    @staticmethod
+    def _encode(value):
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value):
+        self.data[key] = self._encode(value)
+        return True
+
+    def delete(self, *keys):
+        keys = [key.decode() if isinstance(key, bytes) else key for key in keys]
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, match="*"):
+        return [key.encode() for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+    def incr(self, key):
+        value = int(self.data.get(key, b"0")) + 1
+        self.data[key] = self._encode(value)
+        return value
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def hset(self, key, mapping):
+        fields = self.data.setdefault(key, {})
+        fields.update({field: self._encode(value) for field, value in mapping.items()})
+        return len(mapping)
+
+    def hmget(self, key, *fields):
+        stored = self.data.get(key, {})
+        return [stored.get(field) for field in fields]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def stored_bytes(self):
+        size = 0
+        for value in self.data.values():
+            if isinstance(value, dict):
+                size += sum(len(field) + len(v) for field, v in value.items())
+            else:
+                size += len(value)
+        return size
+
+
+class FakePipeline:
+    """
+    Queues the commands until execute(), except for the reads between watch() and multi(), which run immediately.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+        self.buffering = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.commands = []
+
+    def watch(self, *keys):
+        self.buffering = False
+
+    def multi(self):
+        self.buffering = True
+
+    def execute(self):
+        results = [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            if not self.buffering:
+                return getattr(self.redis, name)(*args, **kwargs)
+            self.commands.append((name, args, kwargs))
+            return self
+        return command
+
+
+###########################################################
+class FakeCursor:
+    """
+    A server-side cursor over the synthetic interactions table: (org_id, asset_id, score, id) rows ordered by id.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.position = 0
+        self.itersize = 2000
+
+    def execute(self, query, params=None):
+        self.position = 0
+        if params:
+            # select ... where id >= %s order by id, the ids starting at 1
+            self.position = int(params[0]) - 1
+
+    def fetchmany(self, size):
+        end = min(self.position + size, len(self.table["id"]))
+        rows = list(zip(*[self.table[name][self.position:end].tolist()
+                          for name in ("org_id", "asset_id", "score", "id")]))
+        self.position = end
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self, name=None):
+        return FakeCursor(self.table)
+
+    def close(self):
+        pass
+
+
+###########################################################
+class FakeResponse:
+
+    def __init__(self, text):
+        self.text = text
+
+    def json(self):
+        # parsed on every call, as a real response body would be
+        return json.loads(self.text)
+
+
+class FakeIcarus:
+    """
+    Answers the ICARUS requests of the stages. The endpoints are configured by one placeholder URL in this repository,
+    so the fetch functions are wrapped by route(), which tells which endpoint the requests they make are for.
+    """
+
+    # (module, fetch function name) -> endpoint
+    ROUTES = {(retrieve_data, "get_data_assets"): "data_assets",
+              (retrieve_data, "get_organizations"): "organizations",
+              (semantic_scoring, "get_data_model"): "data_model",
+              (semantic_scoring, "get_dataset_metadata"): "dataset_metadata",
+              (semantic_scoring, "get_user_preferences"): "preferences"}
+
+    def __init__(self, data):
+        self.bodies = {"data_assets": json.dumps([{"id": asset["id"]} for asset in data["assets"]]),
+                       "organizations": json.dumps([{"id": org_id} for org_id in data["organizations"]]),
+                       "data_model": json.dumps(data["data_model"]),
+                       "dataset_metadata": json.dumps(data["assets"])}
+        self.preferences = {str(org_id): json.dumps({"categories": [{"name": name} for name in names]})
+                            for org_id, names in data["preferences"].items()}
+        self.requests = 0
+        # the endpoint of the fetch function running in the thread, set by route()
+        self.local = threading.local()
+
+    def route(self):
+        """
+        Wraps the fetch functions of the stages, so that their requests are answered by the endpoint they are for.
+        """
+        for (module, name), endpoint in self.ROUTES.items():
+            if not hasattr(module, name):
+                raise RuntimeError(f'{module.__name__}.{name} fetches from ICARUS, but it does not exist anymore')
+            setattr(module, name, self._routed(getattr(module, name), endpoint))
+
+    def _routed(self, function, endpoint):
+        @functools.wraps(function)
+        def routed(*args, **kwargs):
+            previous = getattr(self.local, "endpoint", None)
+            self.local.endpoint = endpoint
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.endpoint = previous
+        return routed
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        endpoint = getattr(self.local, "endpoint", None)
+        if endpoint is None:
+            raise RuntimeError(f'ICARUS request to {url} outside of the fetch functions in FakeIcarus.ROUTES')
+        if endpoint == "preferences":
+            return FakeResponse(self.preferences.get(url.rsplit("/", 1)[-1], '{"categories": []}'))
+        return FakeResponse(self.bodies[endpoint])
+
+
+###########################################################
+def synthetic_data(n_orgs, n_assets, n_categories, n_interactions, seed=0):
+    """
+    Generates the organizations, the data assets with their categories and columns, the Aviation Data Model, the preferences and the interactions.
+
+    The interactions follow a Zipf-like popularity over the data assets, as a few data assets usually draw most of them.
+    """
+    rng = np.random.default_rng(seed)
+    subcategories_per_category = 5
+    data_model = [{"text": f"category{c}",
+                   "children": [{"text": f"category{c}sub{s}"} for s in range(subcategories_per_category)]}
+                  for c in range(n_categories)]
+    names = [sub["text"] for cat in data_model for sub in cat["children"]]
+
+    organizations = list(range(1, n_orgs + 1))
+    assets = []
+    for asset_id in range(1, n_assets + 1):
+        categories = rng.choice(len(names), size=rng.integers(1, 4), replace=False)
+        columns = rng.choice(len(names), size=rng.integers(2, 10))
+        owner = int(rng.integers(1, n_orgs + 1))
+        assets.append({"id": asset_id,
+                       "name": f"data asset {asset_id}",
+                       "coverphoto": str(asset_id % 50),
+                       "organization": {"id": owner, "name": f"organization {owner}"},
+                       "categories": [{"name": names[n]} for n in categories.tolist()],
+                       "columns": [{"title": f"table.{names[n]}"} for n in columns.tolist()]})
+    preferences = {org_id: [names[n] for n in rng.choice(len(names), size=rng.integers(0, 6), replace=False).tolist()]
+                   for org_id in organizations}
+
+    popularity = 1.0 / np.arange(1, n_assets + 1)
+    popularity /= popularity.sum()
+    interactions = {"org_id": rng.integers(1, n_orgs + 1, n_interactions),
+                    "asset_id": rng.permutation(n_assets)[rng.choice(n_assets, n_interactions, p=popularity)] + 1,
+                    "score": rng.integers(1, 4, n_interactions),
+                    "id": np.arange(1, n_interactions + 1)}
+    return {"organizations": organizations, "assets": assets, "data_model": data_model,
+            "preferences": preferences, "interactions": interactions}
+
+
+def install_substitutes(data, workdir):
+    """
+    Points the stages to the substitutes and makes them write their artifact generations under workdir/src, as in debug mode.
+
+    return: the Redis substitute and the ICARUS substitute
+    """
+    redis = FakeRedis()
+    icarus = FakeIcarus(data)
+    icarus.route()
+    for module in STAGE_MODULES:
+        module.conn = redis
+        if hasattr(module, "debug"):
+            module.debug = True
+    generations.debug = True
+
+    http_client.get = icarus.get
+    retrieve_data.requests = SimpleNamespace(get=icarus.get)
+    retrieve_data.psycopg2 = SimpleNamespace(connect=lambda **kwargs: FakeConnection(data["interactions"]),
+                                             Error=Exception)
+    os.chdir(workdir)
+    return redis, icarus
+
+
+def run_stages(stages, measure_memory=True):
+    """
+    Runs the given pipeline stages one after the other, passing their outputs as src/pipeline.py does.
+
+    return: a list of dictionaries with the name, the wall time in seconds, the peak memory in bytes (None if not measured) and whether it failed, for each stage
+    """
+    results = {}
+    report = []
+    for name in stages:
+        function = pipeline.STAGES[name][1]
+        gc.collect()
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        failed = False
+        try:
+            results[name] = function(results)
+        except Exception as err:
+            # unlike the pipeline, which skips them, the dependent stages still run on what the substitutes hold,
+            # so that every stage is measured
+            logger.error(f'Stage {name} failed: {err}')
+            results[name] = None
+            failed = True
+        seconds = time.perf_counter() - start
+        peak = None
+        if measure_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        report.append({"stage": name, "seconds": seconds, "peak_memory": peak, "failed": failed})
+    return report
+
+
+def print_report(report, sizes, redis):
+    print("synthetic data: " + ", ".join(f"{key}={value}" for key, value in sizes.items()))
+    print(f"{'stage':<24}{'seconds':>10}{'peak MiB':>12}")
+    for row in report:
+        peak = "-" if row["peak_memory"] is None else f"{row['peak_memory'] / 2 ** 20:.1f}"
+        print(f"{row['stage']:<24}{row['seconds']:>10.2f}{peak:>12}" + ("  FAILED" if row["failed"] else ""))
+    print(f"{'total':<24}{sum(row['seconds'] for row in report):>10.2f}")
+    print(f"Redis footprint: {redis.stored_bytes() / 2 ** 20:.1f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the training pipeline stages on synthetic data.")
+    parser.add_argument("--orgs", type=int, default=200)
+    parser.add_argument("--assets", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=40, help="abstract categories, 5 sub-categories each")
+    parser.add_argument("--interactions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", help="comma separated stages to run (default: all): " + ", ".join(pipeline.STAGES))
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory, for undisturbed wall times")
+    parser.add_argument("--output", help="also write the report as JSON to this file, to compare runs")
+    parser.add_argument("--keep", action="store_true", help="keep the directory with the stages' files")
+    parser.add_argument("--verbose", action="store_true", help="show the stages' logs")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    stages = args.stages.split(",") if args.stages else list(pipeline.STAGES)
+    unknown = [name for name in stages if name not in pipeline.STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {unknown}")
+
+    sizes = {"orgs": args.orgs, "assets": args.assets, "categories": args.categories,
+             "interactions": args.interactions}
+    data = synthetic_data(args.orgs, args.assets, args.categories, args.interactions, args.seed)
+    output = os.path.abspath(args.output) if args.output else None
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="recommender-benchmark-")
+    try:
+        redis, _ = install_substitutes(data, workdir)
+        with generations.new_generation({"stages": stages}):
+            report = run_stages(stages, measure_memory=not args.no_memory)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Stage files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report, sizes, redis)
+    if output:
+        with open(output, "w") as f:
+            json.dump({"sizes": sizes, "stages": report, "redis_bytes": redis.stored_bytes()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
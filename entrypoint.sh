@@ -12,4 +12,5 @@ BASH_ENV=/container.env
 crontab  sheduler.txt
 cron
 
-python /code/src/recommender.py
+# the API runs in gunicorn worker processes, configured by /code/gunicorn.conf.py
+exec gunicorn --config /code/gunicorn.conf.py recommender:app
@@ -0,0 +1,51 @@
+import os
+import gc
+import tempfile
+import multiprocessing
+from dotenv import load_dotenv
+load_dotenv()
+
+# Production serving of the recommender API: gunicorn --config gunicorn.conf.py recommender:app
+# (found automatically when gunicorn is started from /code)
+
+bind = "0.0.0.0:" + os.getenv("api_port", "5000")
+
+# each worker is a process serving `api_threads` requests at once, so a slow call to ICARUS only holds one thread
+workers = int(os.getenv("api_workers", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "gthread"
+threads = int(os.getenv("api_threads", "8"))
+
+timeout = int(os.getenv("api_timeout", "60"))
+# seconds a worker being replaced (kill -HUP) gets to finish the requests it has accepted
+graceful_timeout = int(os.getenv("api_graceful_timeout", "30"))
+keepalive = 5
+# restart workers after this many requests (0 never), spread by the jitter so they do not restart together
+max_requests = int(os.getenv("api_max_requests", "0"))
+max_requests_jitter = max_requests // 10
+
+# the application and its artifacts are loaded once in the master, the forked workers share their memory pages
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+
+# the workers write their metrics there, /metrics aggregates them; a new directory per start, kept on reload (kill -HUP)
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="recommender-metrics-")
+
+
+def pre_fork(server, worker):
+    # objects loaded by the master are never collected, so the collector does not write to (and copy) their pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # threads do not survive the fork, each worker starts its own; artifacts rewritten since the preload are reloaded
+    import recommender
+    recommender.start_background_tasks()
+
+
+def child_exit(server, worker):
+    # the gauges of a dead worker are dropped, its counters and histograms are kept in the totals
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,113 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# name -> {"path", "loader", "default", "signature", "data"}
+_artifacts = {}
+_lock = threading.Lock()
+_reloader = None
+
+
+def _signature(path):
+    """
+    Returns the (path, mtime, size) triple used to detect that an artifact file was rewritten or that a symlink on its path was switched, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def _load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def register(name, path, loader=_load_json, default=None):
+    """
+    Registers an artifact file and parses it once.
+
+    param name: the name the artifact is looked up with
+    param path: the path of the artifact file
+    param loader: a callable receiving the path and returning the parsed artifact
+    param default: the value served while the file cannot be read
+    """
+    with _lock:
+        _artifacts[name] = {"path": path, "loader": loader, "default": default,
+                            "signature": None, "data": default}
+    reload(name)
+
+
+def reload(name):
+    """
+    Re-parses the given artifact if its file changed since it was last loaded.
+
+    return: True if a new version was loaded; False otherwise
+    """
+    entry = _artifacts[name]
+    # resolved once, so that an artifact made of several files is read from a single generation even if the
+    # `current` symlink is switched meanwhile
+    path = os.path.realpath(entry["path"])
+    signature = _signature(path)
+    if signature is None:
+        if entry["signature"] is None:
+            logger.critical(f'Artifact {name} is not available at {entry["path"]}')
+        return False
+    if signature == entry["signature"]:
+        return False
+    try:
+        data = entry["loader"](path)
+    except (OSError, ValueError) as err:
+        # most likely caught mid-write, keep serving the previous version
+        logger.error(f'While reading artifact {name}: {err}')
+        return False
+    with _lock:
+        entry["data"] = data
+        entry["signature"] = signature
+    logger.info(f'Artifact {name} (re)loaded from {path}')
+    return True
+
+
+def reload_all():
+    for name in list(_artifacts):
+        reload(name)
+
+
+def get(name):
+    """
+    Returns the parsed content of an artifact, as it was at the last (re)load.
+    """
+    return _artifacts[name]["data"]
+
+
+def _reload_loop(interval, stop_event):
+    while not stop_event.wait(interval):
+        try:
+            reload_all()
+        except Exception as err:
+            logger.error(f'While reloading artifacts: {err}')
+
+
+def start_reloader(interval):
+    """
+    Starts a daemon thread that checks every `interval` seconds whether any registered artifact changed on disk and reloads it.
+    """
+    global _reloader
+    if _reloader is not None and _reloader[0].is_alive():
+        return
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_reload_loop, args=(interval, stop_event),
+                              name="artifact-reloader", daemon=True)
+    thread.start()
+    _reloader = (thread, stop_event)
+
+
+def stop_reloader():
+    global _reloader
+    if _reloader is not None:
+        _reloader[1].set()
+        _reloader = None
@@ -0,0 +1,135 @@
+import os
+import time
+import logging
+import threading
+import redis
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# The data assets to exclude from an organization's recommendations (those it owns or purchased, those it cannot
+# see) are kept per organization for exclusion_cache_ttl seconds. An invalidation (e.g. on a purchase) drops them in
+# this process at once and is published to Redis for the other processes and instances:
+#   exclusions:invalidations   a sorted set with the invalidated organization IDs as members, scored by Redis time
+INVALIDATIONS_KEY = "exclusions:invalidations"
+
+# seconds an organization's exclusion sets are reused before being fetched from ICARUS again (0 disables the cache)
+exclusion_cache_ttl = float(os.getenv("exclusion_cache_ttl", "300"))
+# organizations whose exclusion sets are kept; the least recently used is evicted first
+exclusion_cache_size = int(os.getenv("exclusion_cache_size", "10000"))
+# invalidations read again at every sync, in case they were published just before the previous one read the set
+invalidation_overlap = 5
+
+conn = redis.Redis('redis',
+                   socket_connect_timeout=float(os.getenv("redis_connect_timeout", "0.5")),
+                   socket_timeout=float(os.getenv("redis_timeout", "1")))
+
+# (kind, organization ID) -> frozenset of data asset IDs
+_cache = TTLCache(max_size=exclusion_cache_size, ttl=exclusion_cache_ttl)
+# organization ID -> monotonic time of its last invalidation in this process
+_invalidated = TTLCache(max_size=exclusion_cache_size, ttl=exclusion_cache_ttl)
+# Redis time up to which the published invalidations were applied, None before the first sync
+_synced_until = None
+_syncer = None
+
+
+def lookup(kind, org_id):
+    """
+    return: the cached exclusion set of the given kind ("owned", "not_visible") of an organization, None if not cached
+    """
+    return _cache.get((kind, str(org_id)))
+
+
+def store(kind, org_id, dataset_ids, fetched_at):
+    """
+    Caches an exclusion set of an organization, unless it was invalidated since the set was fetched.
+
+    param fetched_at: the time.monotonic() at which the fetch of the set started
+    """
+    invalidated_at = _invalidated.get(str(org_id))
+    if invalidated_at is not None and fetched_at <= invalidated_at:
+        return
+    _cache.set((kind, str(org_id)), frozenset(dataset_ids))
+
+
+def _drop(org_id):
+    _invalidated.set(str(org_id), time.monotonic())
+    for kind in ("owned", "not_visible"):
+        _cache.delete((kind, str(org_id)))
+
+
+def _redis_time():
+    seconds, microseconds = conn.time()
+    return seconds + microseconds / 1e6
+
+
+def invalidate(org_id):
+    """
+    Drops the exclusion sets of an organization, in this process and (through Redis) in the others.
+
+    return: True if the invalidation was published to Redis; False if only this process was invalidated
+    """
+    _drop(org_id)
+    try:
+        now = _redis_time()
+        pipe = conn.pipeline()
+        pipe.zadd(INVALIDATIONS_KEY, {str(org_id): now})
+        # older invalidations concern exclusion sets that have expired anyway
+        pipe.zremrangebyscore(INVALIDATIONS_KEY, "-inf", now - exclusion_cache_ttl - invalidation_overlap)
+        pipe.execute()
+    except redis.RedisError as err:
+        logger.warning(f'Invalidation of org {org_id} cannot be published to Redis: {err}')
+        return False
+    return True
+
+
+def sync():
+    """
+    Applies the invalidations published since the previous sync.
+
+    return: True if they could be read; False otherwise
+    """
+    global _synced_until
+    try:
+        now = _redis_time()
+        if _synced_until is not None:
+            invalidated = conn.zrangebyscore(INVALIDATIONS_KEY, _synced_until, "+inf")
+            for org_id in invalidated:
+                _drop(org_id.decode())
+    except redis.RedisError as err:
+        logger.warning(f'Exclusion invalidations cannot be read from Redis: {err}')
+        _synced_until = None
+        return False
+    if _synced_until is None:
+        # first sync, or the invalidations published while Redis could not be reached are unknown
+        _cache.clear()
+    _synced_until = now - invalidation_overlap
+    return True
+
+
+def _sync_loop(interval, stop_event):
+    while True:
+        sync()
+        if stop_event.wait(interval):
+            return
+
+
+def start_syncer(interval):
+    """
+    Starts a daemon thread applying the invalidations published by the other processes every `interval` seconds, which bounds how long they serve dropped exclusion sets.
+    """
+    global _syncer
+    if _syncer is not None and _syncer[0].is_alive():
+        return
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_sync_loop, args=(interval, stop_event),
+                              name="exclusion-invalidations", daemon=True)
+    thread.start()
+    _syncer = (thread, stop_event)
+
+
+def stop_syncer():
+    global _syncer
+    if _syncer is not None:
+        _syncer[1].set()
+        _syncer = None
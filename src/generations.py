@@ -0,0 +1,425 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import datetime
+from contextlib import contextmanager
+import redis
+import recommendation_store
+
+logger = logging.getLogger(__name__)
+
+# The files written by the pipeline (score tables, models, recommendations...) are kept in generations:
+#   artifacts/generations/<id>/                a directory per pipeline run, <id> sorting by creation time
+#   artifacts/generations/<id>/manifest.json   written last: the checksum, size and row count of every file
+#   artifacts/current -> generations/<id>      the generation the API serves and the next run starts from
+# A run starts from hard links to the files of the current generation and replaces those it rewrites (never writing
+# in place, which would change the linked files too), so a generation never changes once committed. Committing or
+# rolling back swaps the `current` symlink with a rename, which readers see all at once.
+# The API reads the recommendations from Redis first: a manifest records the Redis generation of its recommendations
+# (see recommendation_store.py), which is served along with the generation.
+
+debug = False
+
+# committed generations kept besides the current one
+artifact_generations_kept = int(os.getenv("artifact_generations_kept", "5"))
+# uncommitted generations older than this (in seconds) are left over by failed runs and removed
+abandoned_generation_age = 24 * 3600
+
+MANIFEST = "manifest.json"
+# the metadata entry holding the Redis generation of the recommendations, None if they are only on disk
+REDIS_GENERATION = "recommendations_generation"
+
+# where the files were written before generations, to start the first generation from them
+_LEGACY_PATHS = {"recommendations": "recommendations",
+                 "datasets_info": "models_scoring/datasets_info",
+                 "sparsity": "models_scoring/sparsity",
+                 "semantic_scoring": "models_scoring/semantic_scoring",
+                 "item_based_scoring": "models_scoring/item_based_scoring",
+                 "user_based_scoring": "models_scoring/user_based_scoring",
+                 "interaction_size": "models_training/interaction_size",
+                 "item_neighbors": "models_training/item_neighbors",
+                 "item_base_model_dump": "models_training/item_base_model_dump",
+                 "user_base_model_dump": "models_training/user_base_model_dump"}
+
+# the directory of the generation being written by this process, if any
+_active = None
+# the metadata recorded by the stages for the generation being written, and the Redis generation it started from
+_recorded = {}
+_inherited_redis_generation = None
+
+
+def source_dir():
+    return './src' if debug else '/code/src'
+
+
+def artifacts_dir():
+    return os.path.join(source_dir(), 'artifacts')
+
+
+def generations_dir():
+    return os.path.join(artifacts_dir(), 'generations')
+
+
+def current_link():
+    return os.path.join(artifacts_dir(), 'current')
+
+
+def current_path(name):
+    """
+    return: the path of a file of the current generation, through the `current` symlink
+    """
+    return os.path.join(current_link(), name)
+
+
+def path(name):
+    """
+    return: the path of a file of the generation being written, or of the current generation if none is
+    """
+    if _active is not None:
+        return os.path.join(_active, name)
+    return current_path(name)
+
+
+def manifest_metadata(generation):
+    """
+    return: the metadata of a committed generation, empty if its manifest cannot be read
+    """
+    try:
+        with open(os.path.join(generations_dir(), generation, MANIFEST)) as f:
+            return json.load(f).get("metadata", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def current_generation():
+    """
+    return: the ID of the current generation, None if there is none yet
+    """
+    try:
+        return os.path.basename(os.readlink(current_link()))
+    except OSError:
+        return None
+
+
+def list_generations():
+    """
+    return: the IDs of the committed generations, oldest first
+    """
+    if not os.path.isdir(generations_dir()):
+        return []
+    return sorted(entry.name for entry in os.scandir(generations_dir())
+                  if entry.is_dir() and os.path.exists(os.path.join(entry.path, MANIFEST)))
+
+
+###########################################################
+@contextmanager
+def writing(name):
+    """
+    Yields a temporary path to write a file of the generation to, which then replaces the file.
+    """
+    final_path = path(name)
+    tmp_path = final_path + '.tmp'
+    try:
+        yield tmp_path
+        os.replace(tmp_path, final_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_text(name, text):
+    with writing(name) as tmp_path:
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+
+
+def write_json(name, data):
+    with writing(name) as tmp_path:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+
+
+def record(name, value):
+    """
+    Records a value in the manifest metadata of the generation being written.
+    """
+    _recorded[name] = value
+
+
+###########################################################
+def _link_files(files, destination):
+    for source in files:
+        target = os.path.join(destination, os.path.basename(source))
+        try:
+            os.link(source, target)
+        except OSError:
+            # another filesystem
+            shutil.copy2(source, target)
+
+
+def _legacy_files():
+    files = []
+    for name, legacy_path in _LEGACY_PATHS.items():
+        directory, base = os.path.split(os.path.join(source_dir(), legacy_path))
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith('.tmp') and \
+                    (entry.name == base or entry.name.startswith(base + '.')):
+                files.append(entry.path)
+    return files
+
+
+def begin():
+    """
+    Creates a new generation holding the files of the current one (or those written before generations existed), and makes it the generation the stages of this process write to.
+
+    return: the directory of the new generation
+    """
+    global _active, _inherited_redis_generation
+    generation = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    directory = os.path.join(generations_dir(), generation)
+    os.makedirs(directory)
+
+    current = current_generation()
+    if current is not None:
+        source = os.path.join(generations_dir(), current)
+        files = [entry.path for entry in os.scandir(source)
+                 if entry.is_file() and entry.name != MANIFEST and not entry.name.endswith('.tmp')]
+    else:
+        files = _legacy_files()
+    _link_files(files, directory)
+
+    _active = directory
+    # the recommendations file is linked from the current generation until a stage rewrites it, and so are their
+    # Redis copies
+    _inherited_redis_generation = manifest_metadata(current).get(REDIS_GENERATION) if current is not None else None
+    _recorded.clear()
+    _recorded[REDIS_GENERATION] = _inherited_redis_generation
+    logger.info(f'Writing generation {generation}, starting from {current or "the files outside generations"}')
+    return directory
+
+
+def _checksum(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _rows(file_path):
+    """
+    return: the number of rows of a score table index or of entries of a JSON object, None for other files
+    """
+    name = os.path.basename(file_path)
+    if name in ('datasets_info', 'item_neighbors') or name.endswith('.ids.json'):
+        try:
+            with open(file_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return len(data["rows"]) if name.endswith('.ids.json') else len(data)
+    return None
+
+
+def _manifest(directory, metadata=None):
+    """
+    Describes the files of a generation; the checksums of the files still linked to the current generation are taken from its manifest instead of being computed again.
+    """
+    previous = {}
+    current = current_generation()
+    if current is not None:
+        previous_dir = os.path.join(generations_dir(), current)
+        try:
+            with open(os.path.join(previous_dir, MANIFEST)) as f:
+                previous = json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            previous = {}
+
+    files = {}
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if not entry.is_file() or entry.name == MANIFEST or entry.name.endswith('.tmp'):
+            continue
+        linked = os.path.join(generations_dir(), current or '', entry.name)
+        if entry.name in previous and current is not None and os.path.exists(linked) and \
+                os.path.samefile(entry.path, linked):
+            files[entry.name] = previous[entry.name]
+            continue
+        files[entry.name] = {"sha256": _checksum(entry.path), "bytes": entry.stat().st_size,
+                             "rows": _rows(entry.path)}
+    return {"generation": os.path.basename(directory), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "previous": current, "metadata": metadata or {}, "files": files}
+
+
+def switch(generation):
+    """
+    Makes the given committed generation the current one, by making the API read the recommendations it records from Redis (or its recommendations file if it records none), then atomically replacing the `current` symlink.
+
+    raises redis.RedisError: if Redis cannot be switched, the current generation is then unchanged
+    """
+    if generation not in list_generations():
+        raise ValueError(f'No committed generation {generation}')
+    recommendation_store.serve(manifest_metadata(generation).get(REDIS_GENERATION))
+    tmp_link = current_link() + '.tmp'
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.join('generations', generation), tmp_link)
+    os.replace(tmp_link, current_link())
+    logger.info(f'Current generation: {generation}')
+
+
+def commit(metadata=None):
+    """
+    Writes the manifest of the generation being written, makes it the current one and removes the old generations.
+
+    return: the ID of the committed generation
+    """
+    global _active
+    directory = _active
+    metadata = dict(metadata or {})
+    metadata.update(_recorded)
+    manifest = _manifest(directory, metadata)
+    tmp_path = os.path.join(directory, MANIFEST + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST))
+    try:
+        switch(manifest["generation"])
+    except BaseException:
+        abort()
+        raise
+    _active = None
+    _recorded.clear()
+    prune()
+    return manifest["generation"]
+
+
+def abort():
+    """
+    Drops the generation being written and the recommendations it wrote to Redis; the current generation is unchanged.
+    """
+    global _active
+    directory = _active
+    _active = None
+    redis_generation = _recorded.get(REDIS_GENERATION)
+    _recorded.clear()
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+        logger.warning(f'Generation {os.path.basename(directory)} dropped')
+    if redis_generation is not None and redis_generation != _inherited_redis_generation:
+        try:
+            recommendation_store.delete_generation(redis_generation)
+        except redis.RedisError as err:
+            logger.warning(f'Recommendations generation {redis_generation} cannot be removed from Redis: {err}')
+
+
+@contextmanager
+def new_generation(metadata=None):
+    """
+    Runs the enclosed code with a new generation to write to, committed if the code does not raise and dropped otherwise.
+
+    param metadata: a dictionary recorded in the manifest, may be updated by the enclosed code
+    """
+    if metadata is None:
+        metadata = {}
+    begin()
+    try:
+        yield metadata
+    except BaseException:
+        abort()
+        raise
+    commit(metadata)
+
+
+def prune():
+    """
+    Removes the committed generations beyond the artifact_generations_kept newest (never the current one) and the abandoned uncommitted ones, and the Redis recommendations of the generations no longer on disk.
+    """
+    committed = list_generations()
+    current = current_generation()
+    kept = set(committed[-artifact_generations_kept:]) | {current}
+    for generation in committed:
+        if generation not in kept:
+            shutil.rmtree(os.path.join(generations_dir(), generation), ignore_errors=True)
+    for entry in os.scandir(generations_dir()):
+        if entry.is_dir() and entry.name not in committed and entry.path != _active and \
+                time.time() - entry.stat().st_mtime > abandoned_generation_age:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    kept_redis_generations = [manifest_metadata(generation).get(REDIS_GENERATION) for generation in list_generations()]
+    try:
+        recommendation_store.remove_generations([g for g in kept_redis_generations if g is not None])
+    except redis.RedisError as err:
+        logger.warning(f'Stale recommendations generations cannot be removed from Redis: {err}')
+
+
+def rollback(generation=None):
+    """
+    Makes the given generation, or the committed one preceding the current, the current one.
+
+    return: the ID of the new current generation
+    """
+    if generation is None:
+        committed = list_generations()
+        current = current_generation()
+        older = [g for g in committed if current is None or g < current]
+        if not older:
+            raise ValueError('No generation older than the current one')
+        generation = older[-1]
+    switch(generation)
+    return generation
+
+
+def verify(generation=None):
+    """
+    Checks the files of a generation (the current one by default) against its manifest.
+
+    return: a list of the problems found, empty if none
+    """
+    generation = generation or current_generation()
+    directory = os.path.join(generations_dir(), generation)
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    problems = []
+    for name, description in manifest["files"].items():
+        file_path = os.path.join(directory, name)
+        if not os.path.exists(file_path):
+            problems.append(f'{name} is missing')
+        elif _checksum(file_path) != description["sha256"]:
+            problems.append(f'{name} does not match its checksum')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lists, checks and rolls back the generations of pipeline artifacts.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--list", action="store_true", help="list the committed generations")
+    group.add_argument("--rollback", nargs="?", const="", metavar="GENERATION",
+                       help="serve the given generation, or the one preceding the current")
+    group.add_argument("--verify", nargs="?", const="", metavar="GENERATION",
+                       help="check the files of the given generation, or of the current one, against its manifest")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        current = current_generation()
+        for generation in list_generations():
+            print(generation + ("  (current)" if generation == current else ""))
+    elif args.rollback is not None:
+        print(rollback(args.rollback or None))
+    else:
+        problems = verify(args.verify or None)
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print("OK")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    main(sys.argv[1:])
@@ -0,0 +1,33 @@
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+load_dotenv()
+
+# (connect, read) timeouts in seconds for every ICARUS call
+timeout = (float(os.getenv("upstream_connect_timeout", "3.05")),
+           float(os.getenv("upstream_read_timeout", "10")))
+
+pool_size = int(os.getenv("upstream_pool_size", "20"))
+
+
+def create_session():
+    """
+    Creates a requests session that keeps connections to ICARUS alive and reuses them across calls and threads.
+    """
+    new_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    new_session.mount("http://", adapter)
+    new_session.mount("https://", adapter)
+    return new_session
+
+
+session = create_session()
+
+
+def get(url, **kwargs):
+    """
+    Performs a GET request over the shared session, with the configured timeouts unless others are given.
+    """
+    kwargs.setdefault("timeout", timeout)
+    return session.get(url, **kwargs)
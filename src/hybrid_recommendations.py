@@ -2,11 +2,14 @@ import os
 import json
 import requests
 from requests.exceptions import HTTPError
-from surprise import dump
 from dotenv import load_dotenv
 import logging
 import sys
 import redis
+import numpy as np
+import score_table
+import generations
+import recommendation_store
 
 load_dotenv()
 
@@ -18,150 +21,220 @@ conn = redis.Redis('redis')
 
 debug = False
 
-def get_semantic_scores(org_id):
-    logger.debug("Trying to retrieve semantic scoring")
+def get_scores(name):
+    """
+    Reads a score matrix written by one of the scorers.
 
-    try:
-        if (debug):
-            with open('./src/models_scoring/semantic_scoring') as f:
-                semantic_scoring = json.load(f)
-        else:
-            with open('/code/src/models_scoring/semantic_scoring') as f:
-                semantic_scoring = json.load(f)
-    except OSError as err:
-        logger.critical('While reading semantic scoring: {0}'.format(err))
+    param name: the name of the score matrix in the artifact generation (semantic_scoring, item_based_scoring or user_based_scoring)
+
+    return: a score table, empty if it cannot be read
+    """
+    logger.debug(f"Trying to retrieve {name}")
 
     try:
-        items = semantic_scoring[org_id]
-    except:
-        logger.warning(f'Organization {org_id} does not exists in semantic scoring matrix')
-        items = semantic_scoring["1"]
-    sorted_by_semantic = sorted(items, key=lambda l: l[0])
+        scoring = score_table.load(generations.path(name))
+    except (OSError, ValueError) as err:
+        logger.critical('While reading {0}: {1}'.format(name, err))
+        return score_table.ScoreTable.empty()
+
+    logger.debug(f"{name} successfully retrieved!")
 
-    logger.debug("Item based scoring successfully retrieved!")
+    return scoring
 
-    return sorted_by_semantic
 
+def dataset_index(data_assets, scorings):
+    """
+    Maps every data asset ID, of the catalog or of any score matrix, to a column.
 
-def get_item_scores(org_id):
-    logger.debug("Trying to retrieve item based scoring")
+    return: a dictionary with data asset IDs as keys and column numbers as values
+    """
+    index = {}
+    for dataset_id in data_assets:
+        index.setdefault(dataset_id, len(index))
+    for scoring in scorings:
+        for dataset_id in scoring.column_ids:
+            index.setdefault(dataset_id, len(index))
+    return index
 
-    try:
-        if (debug):
-            with open('./src/models_scoring/item_based_scoring') as f:
-                item_scoring = json.load(f)
-        else:
-            with open('/code/src/models_scoring/item_based_scoring') as f:
-                item_scoring = json.load(f)
-    except OSError as err:
-        logger.critical('While reading item based scoring: {0}'.format(err))
 
-    try:
-        items = item_scoring[org_id]
-    except:
-        logger.warning(f'Organization {org_id} does not exists in item scoring matrix')
-        items = item_scoring["1"]
-    sorted_by_items = sorted(items, key=lambda l: l[0])
+def aligned_columns(scoring, index):
+    """
+    return: the column of each of the table's data assets in the index
+    """
+    return np.array([index[dataset_id] for dataset_id in scoring.column_ids], dtype=np.int64)
 
-    logger.debug("Item based scoring successfully retrieved!")
 
-    return sorted_by_items
+def source_row(scoring, org, aligned, name):
+    """
+    Reads the scores of an organization from a score table, aligned by data asset ID.
 
+    param aligned: the columns of the table's data assets, as returned by aligned_columns
 
-def get_user_scores(org_id):
-    logger.debug("Trying to retrieve user based scoring")
+    return: the columns and the scores the table holds for the organization, and the score of the other data assets (NaN if none)
+    """
+    if org not in scoring:
+        logger.warning(f'Organization {org} does not exists in {name} matrix')
+        org = "1"
+    row = scoring.row(org)
+    if row is None:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.nan
+    columns, scores, default = row
+    return aligned[columns], np.asarray(scores, dtype=float), np.nan if default is None else default
 
-    try:
-        if (debug):
-            with open('./src/models_scoring/user_based_scoring') as f:
-                user_scoring = json.load(f)
-        else:
-            with open('/code/src/models_scoring/user_based_scoring') as f:
-                user_scoring = json.load(f)
-    except OSError as err:
-        logger.critical('While reading user based scoring: {0}'.format(err))
 
-    try:
-        users = user_scoring[org_id]
-    except:
-        users = user_scoring["1"]
-    sorted_by_users = sorted(users, key=lambda l: l[0])
+class RowBlender:
+    """
+    Blends the rows of the score tables of one organization at a time over the union of the data assets they hold, the others all getting the blend of the tables' defaults; with top-K tables the work and the memory per organization grow with K instead of with the number of data assets.
+    """
 
-    logger.debug("User based scoring successfully retrieved!")
+    def __init__(self, n_columns):
+        # scratch arrays over all the columns, reset after each row
+        self._candidate = np.zeros(n_columns, dtype=bool)
+        self._position = np.full(n_columns, -1, dtype=np.int64)
 
-    return sorted_by_users
+    def blend(self, rows, sparsity):
+        """
+        param rows: the semantic, item and user based rows of the organization, as returned by source_row
 
-def smallest(num1, num2, num3):
-    if (num1 < num2) and (num1 < num3):
-        smallest_num = num1
-    elif (num2 < num1) and (num2 < num3):
-        smallest_num = num2
-    else:
-        smallest_num = num3
-    return smallest_num
+        return: the columns and the hybrid scores of the data assets held by any of the rows, and the hybrid score of the others
+        """
+        for columns, _, _ in rows:
+            self._candidate[columns] = True
+        candidates = np.flatnonzero(self._candidate)
+        self._candidate[candidates] = False
+        self._position[candidates] = np.arange(len(candidates))
 
-def hybrid_model(semantic_scores, item_score, user_score):
-    """
-    This function implements the Semantic Content-based Recommendation Model.
+        values = []
+        for columns, scores, default in rows:
+            row_values = np.full(len(candidates), default)
+            row_values[self._position[columns]] = scores
+            values.append(row_values)
+        self._position[candidates] = -1
 
-    Given the user preferences and the entities mapped to the Aviation Data Model for each column of each dataset, the model computes a score (dot product) for each dataset.
+        defaults = [default for _, _, default in rows]
+        return candidates, hybrid_model(*values, sparsity), hybrid_model(*defaults, sparsity)
 
-    param semantic_scores: a sorted list of list, with the inner lists consist of the data asset IDs and their scores based on the model
-    """
-    logger.debug("Trying to calculate hybrid recommendation model")
+
+def get_sparsity():
     sparsity = 0
     try:
-        if (debug):
-            with open('./src/models_scoring/sparsity', 'r') as f:
-                sparsity = float(f.readline())
-        else:
-            with open('/code/src/models_scoring/sparsity', 'r') as f:
-                sparsity = float(f.readline())
+        with open(generations.path('sparsity'), 'r') as f:
+            sparsity = float(f.readline())
     except OSError as err:
         logger.error('While reading sparsity: {0}'.format(err))
+    return sparsity
+
+
+def hybrid_model(semantic_scores, item_scores, user_scores, sparsity):
+    """
+    This function implements the Hybrid Recommendation Model.
+
+    The semantic score is blended with the mean of the item and user based scores, weighting the collaborative part by the sparsity of the interactions; a part weighted 0 is left out, so that its missing scores (NaN) do not spread to the blend.
+
+    param semantic_scores: an array (or a number) of semantic scores
+    param item_scores: the item based scores of the same data assets
+    param user_scores: the user based scores of the same data assets
+    param sparsity: the sparsity of the interactions
 
-    hybrid_scores = []
-    length = smallest(len(semantic_scores),len(item_score),len(user_score))
-    for i in range(length):
-        asset = [semantic_scores[i][0]]
-        score = semantic_scores[i][1] * (1 - sparsity) + (((item_score[i][1] + user_score[i][1]) / 2) * sparsity)
-        asset.append(score)
-        hybrid_scores.append(asset)
+    return: the hybrid scores, NaN where any of the models has no score
+    """
+    logger.debug("Trying to calculate hybrid recommendation model")
+
+    if sparsity <= 0:
+        hybrid_scores = semantic_scores * 1.
+    elif sparsity >= 1:
+        hybrid_scores = (item_scores + user_scores) / 2
+    else:
+        hybrid_scores = semantic_scores * (1 - sparsity) + ((item_scores + user_scores) / 2) * sparsity
 
     logger.debug("Hybrid Recommendation model successfully calculated!")
 
     return hybrid_scores
 
 
-def generate_recommendation():
+def ranked_recommendations(hybrid_scores):
+    """
+    return: the columns and the hybrid scores of the data assets that could be scored, in descending score order
+    """
+    scored = np.flatnonzero(~np.isnan(hybrid_scores))
+    ranked = scored[np.argsort(-hybrid_scores[scored], kind='stable')]
+    return ranked, hybrid_scores[ranked]
 
+
+def generate_recommendation(organizations=None, data_assets=None, scorings=None):
+    """
+    Blends the semantic, item and user based scores into the recommendations of every organization; the organizations, the data assets and the score tables are read from Redis and disk unless they are given.
+
+    param scorings: a dictionary with the score matrix names (semantic_scoring, item_based_scoring, user_based_scoring) as keys and their score tables as values
+
+    return: the recommendations table written to disk and published to Redis, or None
+    """
     logger.info("Trying to generate recommendations")
-    organizations = json.loads(conn.get('organizations'))['organization-list']
+    if organizations is None:
+        organizations = json.loads(conn.get('organizations'))['organization-list']
     if (len(organizations) == 0):
         logger.warning("No organizations retrieved")
         return None
 
     logger.debug(organizations)
-    recommendations_dict = {}
-    for org in organizations:
-        org = str(org)
-        sorded_by_semantic = get_semantic_scores(org)
-        sorted_by_items = get_item_scores(org)
-        sorted_by_users = get_user_scores(org)
-        recommendations = hybrid_model(sorded_by_semantic, sorted_by_items, sorted_by_users)
-        recommendations_dict[org] = recommendations
+    organizations = [str(org) for org in organizations]
+    if data_assets is None:
+        data_assets = json.loads(conn.get('data-assets'))['data-asset-list']
+
+    # every score matrix is read once and aligned by data asset ID
+    names = ('semantic_scoring', 'item_based_scoring', 'user_based_scoring')
+    if scorings is None:
+        scorings = {}
+    scorings = [scorings[name] if scorings.get(name) is not None else get_scores(name) for name in names]
+    index = dataset_index(data_assets, scorings)
+    dataset_ids = list(index)
+    aligned = [aligned_columns(scoring, index) for scoring in scorings]
+    sparsity = get_sparsity()
+
+    # a missing score matrix would leave every data asset unscored, and the empty recommendations would replace the
+    # previous ones
+    weights = (1 - sparsity, sparsity, sparsity)
+    missing = [name for scoring, name, weight in zip(scorings, names, weights) if weight > 0 and len(scoring) == 0]
+    if missing:
+        logger.critical(f'No scores in {", ".join(missing)}, the previous recommendations are kept')
+        return None
+    no_row = (np.zeros(0, dtype=np.int64), np.zeros(0), np.nan)
+
+    # one organization at a time, over the data assets any of its rows holds; the others are not ranked and share
+    # the default score of the row
+    blender = RowBlender(len(index))
+    rankings = []
+    defaults = np.full(len(organizations), np.nan, dtype=np.float32)
+    for n, org in enumerate(organizations):
+        rows = [source_row(scoring, org, columns, name) if weight > 0 else no_row
+                for scoring, columns, name, weight in zip(scorings, aligned, names, weights)]
+        candidates, hybrid_scores, defaults[n] = blender.blend(rows, sparsity)
+        ranked, ranked_scores = ranked_recommendations(hybrid_scores)
+        rankings.append((candidates[ranked], ranked_scores))
+    if not any(len(columns) for columns, _ in rankings):
+        logger.critical('No data asset could be scored, the previous recommendations are kept')
+        return None
+    recommendations = score_table.ranked(organizations, dataset_ids, rankings, defaults)
 
     try:
-        if(debug):
-            with open('./src/recommendations', 'w') as f:
-                json.dump(recommendations_dict, f)
-        else:
-            with open('/code/src/recommendations', 'w') as f:
-                json.dump(recommendations_dict, f)
+        score_table.save(generations.path('recommendations'), recommendations)
     except OSError as err:
         logger.error('While writing the recommendations matrix: {0}'.format(err))
-    # print(scoring_dict)
-    logger.debug(f'Matrix length: {len(recommendations_dict)} organizations')
+    # the API instances read them from Redis, the file remains their fallback; they are served once the generation
+    # recording them is committed
+    try:
+        generations.record(generations.REDIS_GENERATION, recommendation_store.write(recommendations, conn))
+    except redis.RedisError as err:
+        logger.error('While publishing the recommendations to Redis: {0}'.format(err))
+        # the API then reads the file of the generation instead of the recommendations of the previous one
+        generations.record(generations.REDIS_GENERATION, None)
+    logger.debug(f'Matrix length: {len(recommendations)} organizations')
     logger.info("Generate recommendations successfully calculated!")
 
-generate_recommendation()
+    return recommendations
+
+
+if __name__ == "__main__":
+    with generations.new_generation():
+        generate_recommendation()
+
@@ -0,0 +1,101 @@
+import os
+import time
+import logging
+import threading
+from requests.exceptions import HTTPError
+import http_client
+
+logger = logging.getLogger(__name__)
+
+# seconds after its last successful refresh the live catalog is no longer used (then nothing is recommended)
+catalog_max_age = float(os.getenv("catalog_max_age", "600"))
+# seconds between refreshes; also the minimum time between two refreshes attempted by requests
+refresh_interval = 60
+
+# the IDs of all non-deleted data assets; replaced as a whole on every refresh
+_live_assets = None
+# time.monotonic() of the last successful refresh, and of the last refresh attempted by a request
+_refreshed_at = None
+_attempted_at = None
+_refresher = None
+_refresh_lock = threading.Lock()
+
+
+def refresh():
+    """
+    Downloads the IDs of all non-deleted data assets from ICARUS and atomically swaps them in.
+
+    return: True if the live catalog was refreshed; False otherwise
+    """
+    global _live_assets, _refreshed_at
+    path = "http://" + os.getenv("icarus_internal")
+    try:
+        data = http_client.get(path).json()
+        if 'status' in data:
+            if data['status'] != 200:
+                logger.error(f'Error on live catalog retrieval: {data["status"]}')
+                return False
+    except HTTPError as http_err:
+        logger.error(f'HTTP error occurred: {http_err}')
+        return False
+    except Exception as err:
+        logger.error(f'Other error occurred: {err}')
+        return False
+
+    _live_assets = frozenset(data)
+    _refreshed_at = time.monotonic()
+    logger.debug(f'Live catalog refreshed: {len(_live_assets)} data assets')
+    return True
+
+
+def _fresh():
+    return _refreshed_at is not None and time.monotonic() - _refreshed_at <= catalog_max_age
+
+
+def live_assets():
+    """
+    Returns the frozenset of non-deleted data asset IDs. When there is none yet or it is older than catalog_max_age (the background refresh failing), the request tries to refresh it, but at most one request per refresh_interval, and the others do not wait for it.
+
+    return: a frozenset of data asset IDs, or None if no recent enough one is available
+    """
+    global _attempted_at
+    if not _fresh() and _refresh_lock.acquire(blocking=False):
+        try:
+            now = time.monotonic()
+            if _attempted_at is None or now - _attempted_at >= refresh_interval:
+                _attempted_at = now
+                refresh()
+        finally:
+            _refresh_lock.release()
+    if not _fresh():
+        return None
+    return _live_assets
+
+
+def _refresh_loop(interval, stop_event):
+    while True:
+        refresh()
+        if stop_event.wait(interval):
+            return
+
+
+def start_refresher(interval):
+    """
+    Starts a daemon thread refreshing the live catalog every `interval` seconds, which bounds its staleness.
+    """
+    global _refresher, refresh_interval
+    refresh_interval = interval
+    if _refresher is not None and _refresher[0].is_alive():
+        return
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_refresh_loop, args=(interval, stop_event),
+                              name="live-catalog", daemon=True)
+    thread.start()
+    _refresher = (thread, stop_event)
+
+
+def stop_refresher():
+    global _refresher
+    if _refresher is not None:
+        _refresher[1].set()
+        _refresher = None
@@ -0,0 +1,45 @@
+import os
+import random
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client import multiprocess
+
+# Prometheus metrics of the API. Under gunicorn every worker process writes its values to PROMETHEUS_MULTIPROC_DIR
+# (set in gunicorn.conf.py) and /metrics aggregates them, whichever worker answers.
+
+# share of requests whose details (candidate lists, timings) are logged; slow requests are always logged
+log_sample_rate = float(os.getenv("log_sample_rate", "0.01"))
+# seconds above which a request is logged as slow
+slow_request_seconds = float(os.getenv("slow_request_seconds", "1"))
+
+REQUEST_LATENCY = Histogram("recommender_request_seconds", "Latency of the API requests", ["endpoint"])
+REQUESTS = Counter("recommender_requests_total", "API requests by endpoint and response status", ["endpoint", "status"])
+# auth, recommendations, filter_owned, filter_not_visible, contextual, dataset_info (the walk of the ranked data assets
+# through the filters, until enough are kept)
+STAGE_LATENCY = Histogram("recommender_stage_seconds", "Latency of the steps of a request", ["stage"])
+CACHE_LOOKUPS = Counter("recommender_cache_lookups_total", "Cache lookups by cache and result (hit or miss)",
+                        ["cache", "result"])
+UPSTREAM_ERRORS = Counter("recommender_upstream_errors_total", "Failed or non-200 calls to ICARUS and Redis", ["call"])
+
+
+def sampled():
+    """
+    return: whether the current request is among those logged in detail
+    """
+    return random.random() < log_sample_rate
+
+
+def exposition():
+    """
+    return: the metrics in the Prometheus text format, and its content type
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+def _inner_ids(raw_ids, to_inner):
+    """
+    Maps raw IDs to the trainset's inner IDs, with -1 for the IDs the trainset does not know.
+    """
+    inner_ids = np.full(len(raw_ids), -1, dtype=np.int64)
+    for n, raw_id in enumerate(raw_ids):
+        try:
+            inner_ids[n] = to_inner(raw_id)
+        except ValueError:
+            pass
+    return inner_ids
+
+
+def _knn_adjustments(algo, users, items):
+    """
+    Computes the neighborhood term that KNNBaseline.estimate adds to the baseline, for every (user, item) pair of the given known inner IDs.
+
+    For each y (an item for user-based models, a user for item-based ones) the neighbors' similarities with all requested x are gathered into one matrix, so the top-k selection and the weighted average run for all x at once.
+
+    param algo: a fitted KNNBaseline model
+    param users: an array of inner user IDs
+    param items: an array of inner item IDs
+
+    return: a 2-D array of shape (len(users), len(items))
+    """
+    user_based = algo.sim_options['user_based']
+    xs, ys = (users, items) if user_based else (items, users)
+    global_mean = algo.trainset.global_mean
+
+    adjustments = np.zeros((len(xs), len(ys)))
+    for col, y in enumerate(ys):
+        ratings = algo.yr[y]
+        if len(ratings) == 0:
+            continue
+        neighbors = np.fromiter((x2 for (x2, _) in ratings), dtype=np.int64, count=len(ratings))
+        r = np.fromiter((r for (_, r) in ratings), dtype=float, count=len(ratings))
+        deviations = r - (global_mean + algo.bx[neighbors] + algo.by[y])
+
+        sims = algo.sim[np.ix_(xs, neighbors)]
+        if len(ratings) > algo.k:
+            # stable, so that ties keep the order of heapq.nlargest
+            top = np.argsort(-sims, axis=1, kind='stable')[:, :algo.k]
+            sims = np.take_along_axis(sims, top, axis=1)
+            deviations = deviations[top]
+        positive = sims > 0
+        sims = np.where(positive, sims, 0.)
+        sum_sim = sims.sum(axis=1)
+        sum_ratings = (sims * deviations).sum(axis=1)
+        sum_ratings[positive.sum(axis=1) < algo.min_k] = 0
+        adjustments[:, col] = np.divide(sum_ratings, sum_sim,
+                                        out=np.zeros_like(sum_ratings), where=sum_sim != 0)
+
+    return adjustments if user_based else adjustments.T
+
+
+def predict_matrix(algo, raw_users, raw_items):
+    """
+    Computes, for every given user and item, the same estimate as `algo.predict(user, item).est` of a fitted KNNBaseline model, but in NumPy over its similarity matrix, baselines and ratings.
+
+    param algo: a fitted KNNBaseline model
+    param raw_users: a list of raw user (organization) IDs
+    param raw_items: a list of raw item (data asset) IDs
+
+    return: a 2-D array of shape (len(raw_users), len(raw_items)) with the estimated ratings
+    """
+    trainset = algo.trainset
+    users = _inner_ids(raw_users, trainset.to_inner_uid)
+    items = _inner_ids(raw_items, trainset.to_inner_iid)
+    known_users = users >= 0
+    known_items = items >= 0
+
+    estimates = np.full((len(users), len(items)), trainset.global_mean)
+    estimates[known_users, :] += algo.bu[users[known_users]][:, None]
+    estimates[:, known_items] += algo.bi[items[known_items]][None, :]
+    if known_users.any() and known_items.any():
+        adjustments = _knn_adjustments(algo, users[known_users], items[known_items])
+        estimates[np.ix_(known_users, known_items)] += adjustments
+
+    lower, higher = trainset.rating_scale
+    return np.clip(estimates, lower, higher)
+
@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 import logging
 import redis
 import sys
+import generations
+from models_scoring.batch_prediction import predict_matrix
+from models_scoring.scoring_utils import write_scores
 load_dotenv()
 
 logFormatter = '%(asctime)s - %(levelname)s - %(message)s'
@@ -21,72 +24,56 @@ def calculate_sparsity(item_size,user_size):
 
     logger.info("Calculating Sparsity")
     try:
-        if (debug):
-            with open('./src/models_training/interaction_size', "r") as f:
-                inter_size = int(f.readline())
-        else:
-            with open('/code/src/models_training/interaction_size', "r") as f:
-                inter_size = int(f.readline())
+        with open(generations.path('interaction_size'), "r") as f:
+            inter_size = int(f.readline())
         sparsity = inter_size / (item_size * user_size)
     except OSError as err:
         logger.error('While reading the interaction size: {0}'.format(err))
         sparsity = 0
 
     try:
-        if(debug):
-            with open('./src/models_scoring/sparsity', 'w') as f1:
-                f1.write(str(sparsity))
-        else:
-            with open('/code/src/models_scoring/sparsity', 'w') as f1:
-                f1.write(str(sparsity))
+        generations.write_text('sparsity', str(sparsity))
         logger.info("Sparsity successfully created!")
     except OSError as err:
         logger.error('While writing the sparsity: {0}'.format(err))
 
+    return sparsity
 
-def model_prediction():
-    try:
-        if(debug):
-            _, algo_item = dump.load("./src/models_training/item_base_model_dump")
-        else:
-            _, algo_item = dump.load("/code/src/models_training/item_base_model_dump")
-    except OSError as err:
-        logger.error('While reading the item based model: {0}'.format(err))
-        return None
 
-    data_assets = json.loads(conn.get('data-assets'))['data-asset-list']
-    organizations = json.loads(conn.get('organizations'))['organization-list']
+def model_prediction(algo_item=None, data_assets=None, organizations=None):
+    """
+    Scores every organization against every data asset with the item based model; the model, the data assets and the organizations are read from disk and Redis unless they are given.
+
+    return: the score table written to disk, or None
+    """
+    if algo_item is None:
+        try:
+            _, algo_item = dump.load(generations.path("item_base_model_dump"))
+        except OSError as err:
+            logger.error('While reading the item based model: {0}'.format(err))
+            return None
+
+    if data_assets is None:
+        data_assets = json.loads(conn.get('data-assets'))['data-asset-list']
+    if organizations is None:
+        organizations = json.loads(conn.get('organizations'))['organization-list']
 
     if (len(data_assets)==0 or len(organizations)==0):
         logger.warning("No data assets or organizations retrieved")
         return None
 
     calculate_sparsity(len(data_assets), len(organizations))
-    scoring_dict = {}
     logger.info("Calculating User-Item scoring matrix (item)")
-    for org in organizations:
-        score_list = []
-        for dataset in data_assets:
-            prediction = algo_item.predict(org, dataset)
-            tmp_obj = []
-            tmp_obj.append(dataset)
-            tmp_obj.append(prediction[3])
-            score_list.append(tmp_obj)
-
-        scoring_dict[org] = score_list
+    predictions = predict_matrix(algo_item, organizations, data_assets)
 
     logger.info("User-Item scoring matrix successfully created! (item)")
 
-    try:
-        if (debug):
-            with open('./src/models_scoring/item_based_scoring', 'w') as f:
-                json.dump(scoring_dict, f)
-        else:
-            with open('/code/src/models_scoring/item_based_scoring', 'w') as f:
-                json.dump(scoring_dict, f)
-    except OSError as err:
-        logger.error('While writing the user based score matrix: {0}'.format(err))
-    # print(scoring_dict)
-    logger.debug(f'Matrix length: {len(scoring_dict)} organizations (item)')
+    table = write_scores(generations.path('item_based_scoring'), organizations, data_assets, predictions)
+    logger.debug(f'Matrix length: {len(organizations)} organizations (item)')
+
+    return table
+
 
-model_prediction()
\ No newline at end of file
+if __name__ == "__main__":
+    with generations.new_generation():
+        model_prediction()
@@ -0,0 +1,29 @@
+import os
+import logging
+import score_table
+
+logger = logging.getLogger(__name__)
+
+# number of best scored data assets kept per organization; 0 keeps them all
+scoring_top_k = int(os.getenv("scoring_top_k", "0"))
+
+
+def write_scores(path, organizations, dataset_ids, scores, top_k=None):
+    """
+    Writes a score matrix as a binary score table, keeping only the top-k data assets of each organization if top_k (defaults to scoring_top_k) is set.
+
+    param path: the path of the score matrix, without suffix
+    param organizations: a list of organization IDs
+    param dataset_ids: a list of data asset IDs
+    param scores: a 2-D array with a row per organization and a column per data asset
+
+    return: the written score table
+    """
+    if top_k is None:
+        top_k = scoring_top_k
+    table = score_table.dense(organizations, dataset_ids, scores, top_k)
+    try:
+        score_table.save(path, table)
+    except OSError as err:
+        logger.error('While writing the score matrix {0}: {1}'.format(path, err))
+    return table
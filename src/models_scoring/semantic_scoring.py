@@ -7,6 +7,12 @@ from dotenv import load_dotenv
 import logging
 import sys
 import redis
+import numpy as np
+from scipy import sparse
+import http_client
+import generations
+from concurrent.futures import ThreadPoolExecutor
+from models_scoring.scoring_utils import write_scores
 load_dotenv()
 
 logFormatter = '%(asctime)s - %(levelname)s - %(message)s'
@@ -17,6 +23,9 @@ conn = redis.Redis('redis')
 
 debug = False
 
+# concurrent requests for the organizations' preferences
+semantic_workers = int(os.getenv("semantic_workers", "8"))
+
 
 def get_data_model():
     """
@@ -29,7 +38,7 @@ def get_data_model():
     path = "http://" + os.getenv("icarus_internal")
 
     try:
-        data = requests.get(path).json()
+        data = http_client.get(path).json()
         if 'status' in data:
             if data['status'] != 200:
                 logger.error(
@@ -71,7 +80,7 @@ def get_user_preferences(org_id, data_model):
     path = prefix + str(org_id)
 
     try:
-        data = requests.get(path).json()
+        data = http_client.get(path).json()
         if 'status' in data:
             if data['status'] != 200:
                 return []
@@ -112,7 +121,7 @@ def get_dataset_metadata(data_model):
     """
     logger.debug("Trying to retrieve dataset metadata")
     try:
-        data = requests.get("http://" + os.getenv("icarus_internal")).json()
+        data = http_client.get("http://" + os.getenv("icarus_internal")).json()
 
         if ('status' in data) and ('error' in data):
             if data['status'] != 200:
@@ -169,12 +178,7 @@ def get_dataset_metadata(data_model):
                                      "org_name": org_name, "coverphoto": coverphoto}
 
     try:
-        if(debug):
-            with open('./src/models_scoring/datasets_info', 'w') as f:
-                json.dump(datasets_info, f)
-        else:
-            with open('/code/src/models_scoring/datasets_info', 'w') as f:
-                json.dump(datasets_info, f)
+        generations.write_json('datasets_info', datasets_info)
     except OSError as err:
         logger.error('While writing the datasets information: {0}'.format(err))
 
@@ -185,87 +189,111 @@ def get_dataset_metadata(data_model):
 ###########################################################
 
 
-def semantic_model(user_preferences, dataset_metadata, data_model):
+def semantic_model(preferences, dataset_metadata, data_model):
     """
-    This function implements the Semantic Content-based Recommendation Model.
+    This function implements the Semantic Content-based Recommendation Model for all organizations at once.
 
-    Given the user preferences and the entities mapped to the Aviation Data Model for each column of each dataset, the model computes a score (dot product) for each dataset.
+    Given the user preferences and the entities mapped to the Aviation Data Model for each column of each dataset, the model computes a score (dot product) for each dataset. The categories are encoded as indices of the data model, the datasets as sparse category-count vectors and the preferences as sparse indicator vectors, so all scores come from one sparse matrix product.
 
-    param user_preferences: a list of strings containing the user's preferences
+    param preferences: a list with, for each organization, a list of strings containing the user's preferences
     param dataset_metadata: a dictionary with the data asset IDs as keys and for each one, a list of data categories per column as values
-    param data_model: a dictionary with ADM's sub-categories as keys and abstract categories as values
+    param data_model: a list with ADM's categories and sub-categories
 
-    return: a 2-D sorted list, with the inner list containing the data asset IDs and their scores based on the model
+    return: a list of the data asset IDs, sorted, and a 2-D array with a row of scores per organization and a column per data asset
     """
     logger.debug("Trying to calculate semantic model")
-    scores = []
-    for dataset_id in dataset_metadata:
-        ssum = 0
-        count = 0
-        for up in user_preferences:
-            for col in dataset_metadata[dataset_id]:
-                if up == col:
-                    ssum += 1
-                count += 1
-        count = count * len(user_preferences)
-        if count > 0:
-            score = float(ssum) / count
-        else:
-            score = 0.
-
-        scores.append([dataset_id, score])
-    scores = sorted(scores, key=lambda l: l[1], reverse=True)
+    vocabulary = {}
+    for category in data_model:
+        vocabulary.setdefault(category, len(vocabulary))
+
+    dataset_ids = sorted(dataset_metadata)
+    rows, cols = [], []
+    for n, dataset_id in enumerate(dataset_ids):
+        for col in dataset_metadata[dataset_id]:
+            if col in vocabulary:
+                rows.append(n)
+                cols.append(vocabulary[col])
+    # duplicate (row, col) pairs are summed up into counts
+    dataset_counts = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                       shape=(len(dataset_ids), len(vocabulary)))
+    columns_per_dataset = np.asarray(dataset_counts.sum(axis=1)).ravel()
+
+    rows, cols = [], []
+    for n, user_preferences in enumerate(preferences):
+        for up in set(user_preferences):
+            if up in vocabulary:
+                rows.append(n)
+                cols.append(vocabulary[up])
+    preference_matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                          shape=(len(preferences), len(vocabulary)))
+    preferences_per_org = np.asarray(preference_matrix.sum(axis=1)).ravel()
+
+    matches = (preference_matrix @ dataset_counts.T).toarray()
+    counts = np.outer(preferences_per_org ** 2, columns_per_dataset)
+    scores = np.divide(matches, counts, out=np.zeros_like(matches), where=counts > 0)
     logger.debug("Semantic model successfully calculated")
 
-    return scores
+    return dataset_ids, scores
 
 
-def calculate_semantic_for_org(org_id):
-    data_model = get_data_model()
-    user_preferences = get_user_preferences(org_id, data_model)
-    dataset_metadata = get_dataset_metadata(data_model)
-    scores = semantic_model(user_preferences, dataset_metadata, data_model)
-    score_list = []  # normalize semantic score 1-3
-    for score in scores:
-        score_list.append(score[1])
-    logger.debug(f'Semantic Score List: {score_list}')
-    for score in scores:
-        try:
-            score[1] = (score[1] - min(score_list)) / (
-                max(score_list) - min(score_list)) * 2 + 1  # normilize between 1-3
-        except ZeroDivisionError:
-            logger.warning("Division by zero!")
-            score[1] = 0
-
-    sorted_by_semantic = sorted(scores, key=lambda l: l[0])
-    return sorted_by_semantic
-
-
-def semantic_scoring():
-    organizations = json.loads(conn.get('organizations'))['organization-list']
+def normalize_scores(scores):
+    """
+    Min-max scales each row of the semantic scores between 1 and 3; rows whose scores are all equal become 0.
+
+    param scores: a 2-D array with a row of scores per organization
+
+    return: a 2-D array of the same shape
+    """
+    low = scores.min(axis=1, keepdims=True)
+    spread = scores.max(axis=1, keepdims=True) - low
+    flat = (spread == 0).ravel()
+    if flat.any():
+        logger.warning(f"Division by zero for {int(flat.sum())} organizations!")
+    normalized = np.divide(scores - low, spread, out=np.zeros_like(scores), where=spread != 0) * 2 + 1
+    normalized[flat] = 0
+    return normalized
+
+
+def semantic_scoring(organizations=None):
+    """
+    Scores every organization against every data asset with the semantic model; the organizations are read from Redis unless they are given.
+
+    return: the score table written to disk, or None
+    """
+    if organizations is None:
+        organizations = json.loads(conn.get('organizations'))['organization-list']
     if (len(organizations) == 0):
         logger.warning("No organizations retrieved")
         return None
 
-    scoring_dict = {}
+    # the data model and the catalog are the same for every organization
+    data_model = get_data_model()
+    if data_model is None:
+        logger.warning("No data model retrieved")
+        return None
+    dataset_metadata = get_dataset_metadata(data_model)
+    if not dataset_metadata:
+        logger.warning("No dataset metadata retrieved")
+        return None
+
+    logger.info("Retrieving the preferences of each organization")
+    with ThreadPoolExecutor(max_workers=semantic_workers) as pool:
+        preferences = list(pool.map(
+            lambda org: get_user_preferences(org, data_model), organizations))
+
     logger.info("Calculating Semantic score for each organization")
-    for org in organizations:
-        scores = calculate_semantic_for_org(org)
-        scoring_dict[org] = scores
+    dataset_ids, scores = semantic_model(preferences, dataset_metadata, data_model)
+    scores = normalize_scores(scores)
 
     logger.info("Semantic scoring matrix successfully created!")
 
-    try:
-        if(debug):
-            with open('./src/models_scoring/semantic_scoring', 'w') as f:
-                json.dump(scoring_dict, f)
-        else:
-            with open('/code/src/models_scoring/semantic_scoring', 'w') as f:
-                json.dump(scoring_dict, f)
-    except OSError as err:
-        logger.error(
-            'While writing the semantic score matrix: {0}'.format(err))
-    logger.debug(f'Matrix length: {len(scoring_dict)} organizations')
+    table = write_scores(generations.path('semantic_scoring'), organizations, dataset_ids, scores)
+    logger.debug(f'Matrix length: {len(organizations)} organizations')
+
+    return table
+
 
+if __name__ == "__main__":
+    with generations.new_generation():
+        semantic_scoring()
 
-semantic_scoring()
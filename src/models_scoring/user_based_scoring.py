@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 import logging
 import sys
 import redis
+import generations
+from models_scoring.batch_prediction import predict_matrix
+from models_scoring.scoring_utils import write_scores
 load_dotenv()
 
 logFormatter = '%(asctime)s - %(levelname)s - %(message)s'
@@ -17,49 +20,39 @@ conn = redis.Redis('redis')
 
 debug = False
 
-def model_prediction():
+def model_prediction(algo_item=None, data_assets=None, organizations=None):
+    """
+    Scores every organization against every data asset with the user based model; the model, the data assets and the organizations are read from disk and Redis unless they are given.
 
-    try:
-        if(debug):
-            _, algo_item = dump.load("./src/models_training/user_base_model_dump")
-        else:
-            _, algo_item = dump.load("/code/src/models_training/user_base_model_dump")
-    except OSError as err:
-        logger.error('While reading the user based model: {0}'.format(err))
-        return None
+    return: the score table written to disk, or None
+    """
+    if algo_item is None:
+        try:
+            _, algo_item = dump.load(generations.path("user_base_model_dump"))
+        except OSError as err:
+            logger.error('While reading the user based model: {0}'.format(err))
+            return None
 
-    data_assets = json.loads(conn.get('data-assets'))['data-asset-list']
-    organizations = json.loads(conn.get('organizations'))['organization-list']
+    if data_assets is None:
+        data_assets = json.loads(conn.get('data-assets'))['data-asset-list']
+    if organizations is None:
+        organizations = json.loads(conn.get('organizations'))['organization-list']
 
     if (len(data_assets)==0 or len(organizations)==0):
         logger.warning("No data assets or organizations retrieved")
         return None
 
-    scoring_dict = {}
     logger.info("Calculating User-Item scoring matrix (user)")
-    for org in organizations:
-        score_list = []
-        for dataset in data_assets:
-            prediction = algo_item.predict(org, dataset)
-            tmp_obj = []
-            tmp_obj.append(dataset)
-            tmp_obj.append(prediction[3])
-            score_list.append(tmp_obj)
-
-        scoring_dict[org] = score_list
+    predictions = predict_matrix(algo_item, organizations, data_assets)
 
     logger.info("User-Item scoring matrix successfully created! (user)")
 
-    try:
-        if(debug):
-            with open('./src/models_scoring/user_based_scoring', 'w') as f:
-                json.dump(scoring_dict, f)
-        else:
-            with open('/code/src/models_scoring/user_based_scoring', 'w') as f:
-                json.dump(scoring_dict, f)
-    except OSError as err:
-        logger.error('While writing the user based score matrix: {0}'.format(err))
-    # print(scoring_dict)
-    logger.debug(f'Matrix length: {len(scoring_dict)} organizations (user)')
+    table = write_scores(generations.path('user_based_scoring'), organizations, data_assets, predictions)
+    logger.debug(f'Matrix length: {len(organizations)} organizations (user)')
+
+    return table
+
 
-model_prediction()
\ No newline at end of file
+if __name__ == "__main__":
+    with generations.new_generation():
+        model_prediction()
@@ -0,0 +1,90 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from surprise import KNNBaseline
+from dotenv import load_dotenv
+import generations
+from models_training import incremental_training
+from models_training import interaction_store
+from models_training import item_based_model
+from models_training import user_based_model
+load_dotenv()
+
+logFormatter = '%(asctime)s - %(levelname)s - %(message)s'
+logging.basicConfig(format=logFormatter, level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# processes computing the item and user similarity matrices at the same time; 1 computes them one after the other
+training_workers = int(os.getenv("training_workers", "1"))
+
+MODELS = {"item": item_based_model, "user": user_based_model}
+
+
+def _fit(sim_options, trainset, model_path, baselines):
+    return incremental_training.fit(KNNBaseline(sim_options=sim_options), trainset, model_path, baselines)
+
+
+def model_training(model_data, names, interactions_fingerprint=None):
+    """
+    Fits the given models (item and/or user based) on the same trainset and baselines, which are built and estimated only once, and dumps them.
+
+    param model_data: the Surprise dataset of the interactions
+    param names: a list with "item" and/or "user"
+
+    return: a dictionary with the model names as keys and the fitted models as values
+    """
+    trainset = model_data.build_full_trainset()
+    baselines = incremental_training.estimate_baselines(trainset)
+
+    fitted = {}
+    if training_workers > 1 and len(names) > 1:
+        # Surprise computes similarities while holding the GIL, so the models are fitted in separate processes
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(training_workers, len(names)), mp_context=context) as pool:
+            futures = {name: pool.submit(_fit, MODELS[name].sim_options, trainset,
+                                         generations.path(MODELS[name].model_dump), baselines)
+                       for name in names}
+            for name, future in futures.items():
+                fitted[name] = future.result()
+    else:
+        for name in names:
+            fitted[name] = _fit(MODELS[name].sim_options, trainset,
+                                generations.path(MODELS[name].model_dump), baselines)
+
+    for name in names:
+        MODELS[name].save_model(fitted[name], interactions_fingerprint)
+
+    return fitted
+
+
+def main(user_inter_dict=None):
+    """
+    Trains the item and user based models together, reusing the dumped ones that were trained on the same interactions.
+
+    return: the item based and the user based models (None, None if there are no interactions)
+    """
+    if user_inter_dict is None:
+        user_inter_dict = interaction_store.load()
+    model_data = item_based_model.data_extraction(user_inter_dict)
+    if (model_data is None):
+        return None, None
+
+    interactions_fingerprint = incremental_training.fingerprint(user_inter_dict)
+    models = {}
+    for name, module in MODELS.items():
+        algo = incremental_training.load_if_unchanged(generations.path(module.model_dump),
+                                                      interactions_fingerprint)
+        if algo is not None:
+            logger.info(f"Interactions unchanged, {name}-based model reused")
+            models[name] = algo
+    names = [name for name in MODELS if name not in models]
+    if names:
+        models.update(model_training(model_data, names, interactions_fingerprint))
+
+    return models["item"], models["user"]
+
+
+if __name__ == "__main__":
+    with generations.new_generation():
+        main()
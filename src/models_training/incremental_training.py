@@ -0,0 +1,233 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from surprise import dump
+from surprise import AlgoBase
+from surprise import KNNBaseline
+from surprise.prediction_algorithms.knns import SymmetricAlgo
+
+logger = logging.getLogger(__name__)
+
+# above this share of changed users (or items), a model is fitted from scratch
+incremental_max_changed_ratio = float(os.getenv("incremental_max_changed_ratio", "0.2"))
+
+
+def fingerprint(user_inter_dict):
+    """
+    return: a content hash of the interactions
+    """
+    digest = hashlib.sha256()
+    for name in ("org_id", "asset_id", "score"):
+        column = np.asarray(user_inter_dict[name])
+        if column.dtype == object:
+            digest.update(json.dumps(column.tolist()).encode())
+        else:
+            # the raw bytes of the column, without converting each value to a Python object
+            digest.update(column.dtype.str.encode())
+            digest.update(np.ascontiguousarray(column).tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint_path(model_path):
+    return model_path + '.fingerprint'
+
+
+def write_fingerprint(model_path, interactions_fingerprint):
+    tmp_path = fingerprint_path(model_path) + '.tmp'
+    try:
+        # renamed over the file rather than rewriting it, which may be shared with the previous generation
+        with open(tmp_path, 'w') as f:
+            f.write(interactions_fingerprint)
+        os.replace(tmp_path, fingerprint_path(model_path))
+    except OSError as err:
+        logger.error('While writing the model fingerprint: {0}'.format(err))
+
+
+def load_if_unchanged(model_path, interactions_fingerprint):
+    """
+    return: the model dumped at the given path if it was trained on interactions with the given fingerprint; None otherwise
+    """
+    try:
+        with open(fingerprint_path(model_path)) as f:
+            if f.read().strip() != interactions_fingerprint:
+                return None
+        _, algo = dump.load(model_path)
+    except OSError:
+        return None
+    return algo
+
+
+def ratings_path(model_path):
+    return model_path + '.ratings'
+
+
+def _raw_ids(trainset, user_based):
+    """
+    return: the raw IDs of the users (or items) of a trainset as strings, in inner ID order
+    """
+    raw2inner = trainset._raw2inner_id_users if user_based else trainset._raw2inner_id_items
+    raw_ids = [None] * len(raw2inner)
+    for raw_id, inner_id in raw2inner.items():
+        raw_ids[inner_id] = str(raw_id)
+    return raw_ids
+
+
+def _rating_digests(trainset, user_based):
+    """
+    return: a digest of the ratings of each user (or item) of a trainset, in inner ID order
+    """
+    xr = trainset.ur if user_based else trainset.ir
+    n_x = trainset.n_users if user_based else trainset.n_items
+    return [hashlib.blake2b(np.asarray(xr[x], dtype=float).tobytes(), digest_size=8).hexdigest()
+            for x in range(n_x)]
+
+
+def write_ratings(model_path, algo):
+    """
+    Writes next to a dumped model what fit needs to decide on an incremental update without loading the model: its similarity options, the size and modification time of the dump, and the raw IDs and a digest of the ratings of each of its users (or items).
+    """
+    user_based = algo.sim_options['user_based']
+    tmp_path = ratings_path(model_path) + '.tmp'
+    try:
+        stat = os.stat(model_path)
+        ratings = {"sim_options": algo.sim_options, "dump": [stat.st_size, stat.st_mtime_ns],
+                   "raw_ids": _raw_ids(algo.trainset, user_based),
+                   "digests": _rating_digests(algo.trainset, user_based)}
+        # renamed over the file rather than rewriting it, which may be shared with the previous generation
+        with open(tmp_path, 'w') as f:
+            json.dump(ratings, f)
+        os.replace(tmp_path, ratings_path(model_path))
+    except OSError as err:
+        logger.error('While writing the model ratings: {0}'.format(err))
+
+
+def load_ratings(model_path):
+    """
+    return: what write_ratings wrote for the model dumped at the given path, None if it is missing or describes another dump
+    """
+    try:
+        with open(ratings_path(model_path)) as f:
+            ratings = json.load(f)
+        stat = os.stat(model_path)
+    except (OSError, ValueError):
+        return None
+    if ratings.get("dump") != [stat.st_size, stat.st_mtime_ns]:
+        return None
+    return ratings
+
+
+def cosine_rows(trainset, user_based, xs, min_support):
+    """
+    Computes the rows of the given x (users if user based, items otherwise) of Surprise's cosine similarity matrix, with the same sums over the common ratings as surprise.similarities.cosine.
+
+    return: a 2-D array of shape (len(xs), number of x)
+    """
+    n_x = trainset.n_users if user_based else trainset.n_items
+    xr = trainset.ur if user_based else trainset.ir
+    yr = trainset.ir if user_based else trainset.ur
+    rows = np.zeros((len(xs), n_x))
+    for n, x in enumerate(xs):
+        freq = np.zeros(n_x)
+        prods = np.zeros(n_x)
+        sqi = np.zeros(n_x)
+        sqj = np.zeros(n_x)
+        for y, ri in xr[x]:
+            neighbors = np.array([x2 for (x2, _) in yr[y]], dtype=np.int64)
+            rj = np.array([r for (_, r) in yr[y]], dtype=float)
+            np.add.at(freq, neighbors, 1)
+            np.add.at(prods, neighbors, ri * rj)
+            np.add.at(sqi, neighbors, ri ** 2)
+            np.add.at(sqj, neighbors, rj ** 2)
+        denum = np.sqrt(sqi * sqj)
+        supported = (freq >= min_support) & (denum > 0)
+        np.divide(prods, denum, out=rows[n], where=supported)
+        rows[n, x] = 1
+    return rows
+
+
+def _changed_xs(previous_ratings, trainset, user_based):
+    """
+    param previous_ratings: the ratings written by write_ratings for the previous model
+
+    return: the inner IDs of the x whose ratings differ from the previous model's, or None if the previous x inner IDs are not kept by the new trainset
+    """
+    old_ids, new_ids = previous_ratings["raw_ids"], _raw_ids(trainset, user_based)
+    # new x are appended after the previous ones as long as the interactions were only appended
+    n_old = len(old_ids)
+    if new_ids[:n_old] != old_ids:
+        return None
+    old_digests, new_digests = previous_ratings["digests"], _rating_digests(trainset, user_based)
+    changed = [x for x in range(n_old) if old_digests[x] != new_digests[x]]
+    return changed + list(range(n_old, len(new_ids)))
+
+
+def estimate_baselines(trainset):
+    """
+    Estimates the (bu, bi) baselines of a trainset as KNNBaseline does; they do not depend on the similarity options, so item and user based models can share them.
+    """
+    estimator = KNNBaseline()
+    AlgoBase.fit(estimator, trainset)
+    return estimator.compute_baselines()
+
+
+def fit_with_baselines(algo, trainset, baselines=None):
+    """
+    Fits a KNNBaseline model from scratch, using the given (bu, bi) baselines estimated on the same trainset instead of estimating them again.
+    """
+    if baselines is None:
+        return algo.fit(trainset)
+    SymmetricAlgo.fit(algo, trainset)
+    algo.bu, algo.bi = baselines
+    algo.bx, algo.by = algo.switch(algo.bu, algo.bi)
+    algo.sim = algo.compute_similarities()
+    return algo
+
+
+def fit(algo, trainset, model_path, baselines=None):
+    """
+    Fits a KNNBaseline model, reusing the model previously dumped at the given path when few of its users (or items) have changed ratings: the baselines are re-estimated and only the similarity rows and columns of those are recomputed. Otherwise, or if the similarity is not cosine, the model is fitted from scratch. The changed users (or items) are found from the ratings written along with the dump (see write_ratings), so the previous model is only loaded when it is reused.
+
+    param algo: an unfitted KNNBaseline model
+    param trainset: the trainset to fit on
+    param model_path: the path of the previously dumped model
+    param baselines: the (bu, bi) baselines of the trainset, if already estimated
+
+    return: the fitted model
+    """
+    previous_ratings = None
+    if algo.sim_options.get('name', 'msd').lower() == 'cosine':
+        previous_ratings = load_ratings(model_path)
+    if previous_ratings is None or previous_ratings["sim_options"] != algo.sim_options:
+        return fit_with_baselines(algo, trainset, baselines)
+
+    user_based = algo.sim_options['user_based']
+    changed = _changed_xs(previous_ratings, trainset, user_based)
+    n_x = trainset.n_users if user_based else trainset.n_items
+    if changed is None or len(changed) > incremental_max_changed_ratio * n_x:
+        return fit_with_baselines(algo, trainset, baselines)
+
+    try:
+        _, previous = dump.load(model_path)
+    except Exception as err:
+        logger.warning(f'Previous model cannot be reused: {err}')
+        return fit_with_baselines(algo, trainset, baselines)
+    if previous.sim.shape[0] != len(previous_ratings["raw_ids"]):
+        return fit_with_baselines(algo, trainset, baselines)
+
+    logger.info(f'Updating {len(changed)} of {n_x} similarity rows')
+    SymmetricAlgo.fit(algo, trainset)
+    if baselines is None:
+        baselines = algo.compute_baselines()
+    algo.bu, algo.bi = baselines
+    algo.bx, algo.by = algo.switch(algo.bu, algo.bi)
+    sim = np.zeros((n_x, n_x))
+    n_old = previous.sim.shape[0]
+    sim[:n_old, :n_old] = previous.sim
+    if len(changed) > 0:
+        rows = cosine_rows(trainset, user_based, changed, algo.sim_options.get('min_support', 1))
+        sim[changed, :] = rows
+        sim[:, changed] = rows.T
+    algo.sim = sim
+    return algo
@@ -0,0 +1,204 @@
+import os
+import json
+import logging
+import redis
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+conn = redis.Redis('redis')
+
+# The interactions are stored in Redis as:
+#   user-interaction:meta       {"chunks": number of chunks, "rows": number of interactions}
+#   user-interaction:orgs       JSON list of the organization IDs, an organization is referred to by its index
+#   user-interaction:assets     JSON list of the data asset IDs, likewise
+#   user-interaction:chunk:<n>  the organization indexes, data asset indexes and scores of chunk n, as arrays of the
+#                               smallest type holding them, preceded by their types ("<u2,<u2,|u1\n")
+#   user-interaction-watermark  where the next extraction starts (see retrieve_data.fetch_interactions)
+# New interactions first fill up the last chunk, then are appended as new chunks, so only the last chunk is ever
+# partial.
+KEY = "user-interaction"
+META_KEY = KEY + ":meta"
+ORGS_KEY = KEY + ":orgs"
+ASSETS_KEY = KEY + ":assets"
+WATERMARK_KEY = KEY + "-watermark"
+
+# interactions per chunk key
+interaction_chunk_size = int(os.getenv("interaction_chunk_size", "100000"))
+
+
+def chunk_key(n):
+    return f"{KEY}:chunk:{n}"
+
+
+def empty():
+    return {"org_id": np.array([]), "asset_id": np.array([]), "score": np.array([], dtype=np.float32)}
+
+
+def intern(ids, vocabulary, index):
+    """
+    Maps IDs to their index in the vocabulary, appending the IDs it does not contain yet.
+
+    param ids: an array of IDs
+    param vocabulary: the list of the known IDs, extended in place
+    param index: a dictionary with the known IDs as keys and their index as values, extended in place
+
+    return: an int32 array of indexes
+    """
+    unique, inverse = np.unique(np.asarray(ids), return_inverse=True)
+    codes = np.empty(len(unique), dtype=np.int32)
+    for n, raw_id in enumerate(unique.tolist()):
+        code = index.get(raw_id)
+        if code is None:
+            code = index[raw_id] = len(vocabulary)
+            vocabulary.append(raw_id)
+        codes[n] = code
+    return codes[inverse.reshape(-1)]
+
+
+def _narrow(column):
+    """
+    return: the column as the smallest unsigned integer type holding it, or as float32 if it is not integral
+    """
+    column = np.asarray(column)
+    if column.size == 0:
+        return column.astype(np.uint8)
+    if np.issubdtype(column.dtype, np.number) and column.min() >= 0 and np.array_equal(column, np.floor(column)):
+        for dtype in (np.uint8, np.uint16, np.uint32):
+            if column.max() <= np.iinfo(dtype).max:
+                return column.astype(dtype)
+    return column.astype(np.float32)
+
+
+def encode_chunk(org_codes, asset_codes, scores):
+    columns = [_narrow(org_codes), _narrow(asset_codes), _narrow(scores)]
+    header = ",".join(column.dtype.str for column in columns) + "\n"
+    return header.encode() + b"".join(column.tobytes() for column in columns)
+
+
+def decode_chunk(chunk):
+    """
+    return: the organization indexes, data asset indexes and scores of an encoded chunk, as arrays
+    """
+    end = chunk.index(b"\n")
+    dtypes = [np.dtype(dtype) for dtype in chunk[:end].decode().split(",")]
+    rows = (len(chunk) - end - 1) // sum(dtype.itemsize for dtype in dtypes)
+    columns = []
+    offset = end + 1
+    for dtype in dtypes:
+        columns.append(np.frombuffer(chunk, dtype=dtype, count=rows, offset=offset))
+        offset += rows * dtype.itemsize
+    return columns
+
+
+def decode(orgs, assets, chunks):
+    """
+    Decodes the stored chunks into columns.
+
+    param orgs: the list of organization IDs
+    param assets: the list of data asset IDs
+    param chunks: a list of encoded chunks
+
+    return: a dictionary with the "org_id", "asset_id" and "score" columns as arrays
+    """
+    if not chunks:
+        return empty()
+    org_codes, asset_codes, scores = zip(*[decode_chunk(chunk) for chunk in chunks])
+    return {"org_id": np.asarray(orgs)[np.concatenate(org_codes)],
+            "asset_id": np.asarray(assets)[np.concatenate(asset_codes)],
+            "score": np.concatenate(scores).astype(np.float32)}
+
+
+def load():
+    """
+    Reads all stored interactions; the chunks are read in the same transaction as their metadata, so an append running meanwhile is not half read.
+
+    return: a dictionary with the "org_id", "asset_id" and "score" columns as arrays, None if no interactions are stored
+    """
+    with conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(META_KEY)
+                meta = pipe.get(META_KEY)
+                if meta is None:
+                    return None
+                meta = json.loads(meta)
+                pipe.multi()
+                pipe.get(ORGS_KEY)
+                pipe.get(ASSETS_KEY)
+                for n in range(meta["chunks"]):
+                    pipe.get(chunk_key(n))
+                orgs, assets, *chunks = pipe.execute()
+                break
+            except redis.WatchError:
+                continue
+    return decode(json.loads(orgs), json.loads(assets), chunks)
+
+
+def load_watermark():
+    """
+    return: the watermark of the stored interactions, None if there are none or if it was stored by a previous version (then all interactions are extracted again)
+    """
+    meta, watermark = conn.mget(META_KEY, WATERMARK_KEY)
+    if meta is None or watermark is None:
+        return None
+    watermark = json.loads(watermark)
+    if not isinstance(watermark, dict):
+        return None
+    return watermark
+
+
+def append(records, watermark, replace=False):
+    """
+    Appends interactions to the stored ones, topping up the last chunk if it is partial, and stores their watermark along with them in one transaction.
+
+    param records: a dictionary with the "org_id", "asset_id" and "score" columns
+    param watermark: a JSON serializable description of where the next extraction starts
+    param replace: whether the records replace the stored interactions instead
+    """
+    meta, orgs, assets = conn.mget(META_KEY, ORGS_KEY, ASSETS_KEY)
+    previous_chunks = json.loads(meta)["chunks"] if meta is not None else 0
+    replace = replace or meta is None
+    if replace:
+        meta = {"chunks": 0, "rows": 0}
+        orgs, assets = [], []
+    else:
+        meta = json.loads(meta)
+        orgs, assets = json.loads(orgs), json.loads(assets)
+
+    org_codes = intern(records["org_id"], orgs, {raw_id: n for n, raw_id in enumerate(orgs)})
+    asset_codes = intern(records["asset_id"], assets, {raw_id: n for n, raw_id in enumerate(assets)})
+    scores = np.asarray(records["score"])
+    new_rows = len(org_codes)
+
+    if meta["chunks"] > 0:
+        last_chunk = conn.get(chunk_key(meta["chunks"] - 1))
+        last_codes = decode_chunk(last_chunk) if last_chunk is not None else None
+        if last_codes is not None and len(last_codes[0]) < interaction_chunk_size:
+            # the last chunk is written again with the first new interactions
+            org_codes = np.concatenate([last_codes[0], org_codes])
+            asset_codes = np.concatenate([last_codes[1], asset_codes])
+            scores = np.concatenate([last_codes[2], scores])
+            meta["chunks"] -= 1
+
+    transaction = conn.pipeline()
+    for start in range(0, len(org_codes), interaction_chunk_size):
+        end = start + interaction_chunk_size
+        transaction.set(chunk_key(meta["chunks"]), encode_chunk(org_codes[start:end], asset_codes[start:end],
+                                                               scores[start:end]))
+        meta["chunks"] += 1
+    meta["rows"] += new_rows
+    stale = [chunk_key(n) for n in range(meta["chunks"], previous_chunks)]
+    if stale:
+        transaction.delete(*stale)
+    if replace:
+        # the JSON encoded interactions of the previous versions
+        transaction.delete(KEY)
+    transaction.set(ORGS_KEY, json.dumps(orgs))
+    transaction.set(ASSETS_KEY, json.dumps(assets))
+    transaction.set(META_KEY, json.dumps(meta))
+    transaction.set(WATERMARK_KEY, json.dumps(watermark))
+    transaction.execute()
+    logger.info(f'{new_rows} interactions stored, {meta["rows"]} in total')
@@ -3,10 +3,15 @@ from surprise import Dataset
 from surprise import Reader
 from surprise import dump
 import pandas as pd
+import numpy as np
 import logging
 import redis
 import json
+import generations
+from models_training import incremental_training
+from models_training import interaction_store
 import sys
+import os
 
 logFormatter = '%(asctime)s - %(levelname)s - %(message)s'
 logging.basicConfig(format=logFormatter, level=logging.INFO)
@@ -16,9 +21,23 @@ conn = redis.Redis('redis')
 
 debug = False
 
+# the name of the model dump in the artifact generations
+model_dump = "item_base_model_dump"
 
-def data_extraction():
-    user_inter_dict = json.loads(conn.get("user-interaction"))
+sim_options = {'name': 'cosine',
+               'user_based': False  # compute  similarities between items
+               }
+
+# number of most similar data assets kept per data asset for the API
+neighbors_top_k = int(os.getenv("neighbors_top_k", "20"))
+
+
+def data_extraction(user_inter_dict=None):
+    """
+    Builds the Surprise dataset of the interactions, read from Redis unless they are given.
+    """
+    if user_inter_dict is None:
+        user_inter_dict = interaction_store.load()
     logger.debug(user_inter_dict)
     if (user_inter_dict is None or len(user_inter_dict["org_id"])==0):
         logger.warning("No available interaction data!")
@@ -32,29 +51,83 @@ def data_extraction():
     return data
 
 
-def model_training(data):
-    sim_options = {'name': 'cosine',
-                    'user_based': False  # compute  similarities between items
-                    }
-    algo_item = KNNBaseline(sim_options=sim_options)
+def model_training(data, interactions_fingerprint=None):
     trainset = data.build_full_trainset()
-    algo_item.fit(trainset)
+    algo_item = incremental_training.fit(KNNBaseline(sim_options=sim_options), trainset, generations.path(model_dump))
+    save_model(algo_item, interactions_fingerprint)
+
+    return algo_item
 
+
+def save_model(algo_item, interactions_fingerprint=None):
+    """
+    Dumps the fitted model to disk along with its ratings for incremental training and the fingerprint of the interactions it was trained on.
+    """
     try:
-        if (debug):
-            dump.dump("./src/models_training/item_base_model_dump", algo=algo_item)
-        else:
-            dump.dump("/code/src/models_training/item_base_model_dump", algo=algo_item)
+        # dumped next to the file and renamed over it, as the file may be shared with the previous generation
+        with generations.writing(model_dump) as tmp_path:
+            dump.dump(tmp_path, algo=algo_item)
+        incremental_training.write_ratings(generations.path(model_dump), algo_item)
+        if interactions_fingerprint is not None:
+            incremental_training.write_fingerprint(generations.path(model_dump), interactions_fingerprint)
         logger.info("Item-based model successfully dump to disk")
     except OSError as err:
         logger.error("While writing item-based model to file: {0}".format(err))
 
+    write_neighbor_table(algo_item)
+
+
+def neighbor_table(algo_item, k):
+    """
+    Computes the k most similar data assets of every data asset from the similarity matrix of a fitted item-based model.
+
+    param algo_item: a fitted item-based KNNBaseline model
+    param k: the number of neighbors kept per data asset
 
-def main():
-    model_data = data_extraction()
+    return: a dictionary with the data asset IDs (as strings) as keys and lists of [neighbor data asset ID, similarity] in descending similarity as values
+    """
+    trainset = algo_item.trainset
+    sim = np.array(algo_item.sim, dtype=float)
+    np.fill_diagonal(sim, -np.inf)
+    k = min(k, trainset.n_items - 1)
+    table = {}
+    if k <= 0:
+        return table
+    # unordered top-k per row, then sort only those k
+    top = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+    for inner_id in range(trainset.n_items):
+        row = top[inner_id]
+        row = row[np.argsort(-sim[inner_id, row], kind='stable')]
+        neighbors = [[trainset.to_raw_iid(int(j)), float(sim[inner_id, j])]
+                     for j in row if sim[inner_id, j] > 0]
+        table[str(trainset.to_raw_iid(inner_id))] = neighbors
+    return table
+
+
+def write_neighbor_table(algo_item):
+    table = neighbor_table(algo_item, neighbors_top_k)
+    try:
+        generations.write_json('item_neighbors', table)
+        logger.info("Item neighbor table successfully written to disk")
+    except OSError as err:
+        logger.error("While writing the item neighbor table: {0}".format(err))
+
+
+def main(user_inter_dict=None):
+    if user_inter_dict is None:
+        user_inter_dict = interaction_store.load()
+    model_data = data_extraction(user_inter_dict)
     if (model_data is None):
-        return
-    model_training(model_data)
+        return None
+    # the previous model is still valid if the interactions have not changed
+    interactions_fingerprint = incremental_training.fingerprint(user_inter_dict)
+    algo_item = incremental_training.load_if_unchanged(generations.path(model_dump), interactions_fingerprint)
+    if algo_item is not None:
+        logger.info("Interactions unchanged, item-based model reused")
+        return algo_item
+    return model_training(model_data, interactions_fingerprint)
 
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    with generations.new_generation():
+        main()
@@ -1,9 +1,14 @@
 import psycopg2
 import os
+import time
 import logging
 import requests
 import json
 import redis
+import numpy as np
+from collections import Counter, deque
+import generations
+from models_training import interaction_store
 from requests.exceptions import HTTPError
 from dotenv import load_dotenv
 load_dotenv()
@@ -16,8 +21,99 @@ conn = redis.Redis('redis')
 
 debug = False
 
+# the table holding the interactions, its organization, data asset and score columns, and the increasing column
+# (id or timestamp) used as extraction watermark
+interaction_table = os.getenv("interaction_table")
+org_column = os.getenv("interaction_org_column", "org_id")
+asset_column = os.getenv("interaction_asset_column", "asset_id")
+score_column = os.getenv("interaction_score_column", "score")
+watermark_column = os.getenv("interaction_watermark_column")
+interaction_batch_size = int(os.getenv("interaction_batch_size", "10000"))
+# last extracted rows read again at every run, to catch the rows sharing their watermark value or committed late
+interaction_watermark_overlap = int(os.getenv("interaction_watermark_overlap", "1000"))
+# seconds between full extractions, which also pick up the updated and deleted rows (0 never)
+interaction_full_extraction_interval = float(os.getenv("interaction_full_extraction_interval", "86400"))
+
+
+def _row_key(row):
+    return [str(value) for value in row]
+
+
+def fetch_interactions(connection, watermark=None):
+    """
+    Streams the interactions from the watermark on (all of them if there is none) through a server-side cursor, in batches, into a columnar buffer.
+
+    The last interaction_watermark_overlap extracted rows (the tail) are read again at every run and skipped, so that the rows sharing their watermark value, or committed late with a value among theirs, are not lost. The rows before the tail sharing the watermark value of its first row are read again too, but only their number is kept: the first that many rows with that value not in the tail are skipped, so a late row is only told apart from them by its position.
+
+    param connection: an open database connection
+    param watermark: the watermark stored by the previous extraction: {"start": the watermark column value of the first row of the tail, "skip": the number of rows before the tail with that value, "tail": the rows of the tail}, or None
+
+    return: a dictionary with the "org_id", "asset_id" and "score" columns of the new interactions as arrays, and the new watermark (None if no row was read)
+    """
+    # a named cursor is server-side: rows are transferred batch by batch instead of all at once
+    cursor = connection.cursor(name="user_interaction_cursor")
+    cursor.itersize = interaction_batch_size
+    postgreSQL_select_Query = f"select {org_column}, {asset_column}, {score_column}, {watermark_column} " \
+                              f"from {interaction_table}"
+    if watermark is None:
+        cursor.execute(postgreSQL_select_Query + f" order by {watermark_column}")
+        seen = Counter()
+        start, skip = None, 0
+    else:
+        cursor.execute(postgreSQL_select_Query + f" where {watermark_column} >= %s order by {watermark_column}",
+                       (watermark["start"],))
+        seen = Counter(tuple(row) for row in watermark["tail"])
+        start, skip = watermark["start"], watermark.get("skip", 0)
+
+    chunks = {"org_id": [], "asset_id": [], "score": []}
+    # the last rows read, and the number of rows before them sharing the watermark value of the first one
+    tail = deque(maxlen=max(1, interaction_watermark_overlap))
+    ties = 0
+    while True:
+        rows = cursor.fetchmany(interaction_batch_size)
+        if len(rows) == 0:
+            break
+        for row in rows:
+            if len(tail) == tail.maxlen:
+                evicted = tail[0]
+                tail.append(row)
+                ties = ties + 1 if evicted[3] == tail[0][3] else 0
+            else:
+                tail.append(row)
+        if seen or skip:
+            new_rows = []
+            for row in rows:
+                key = tuple(_row_key(row))
+                if seen[key] > 0:
+                    seen[key] -= 1
+                elif skip > 0 and key[3] == start:
+                    skip -= 1
+                else:
+                    new_rows.append(row)
+            rows = new_rows
+            if len(rows) == 0:
+                continue
+        org_id, asset_id, score, _ = zip(*rows)
+        chunks["org_id"].append(np.asarray(org_id))
+        chunks["asset_id"].append(np.asarray(asset_id))
+        chunks["score"].append(np.asarray(score))
+    cursor.close()
+
+    columns = {}
+    for name, column_chunks in chunks.items():
+        columns[name] = np.concatenate(column_chunks) if column_chunks else np.array([])
+    if len(tail) == 0:
+        return columns, None
+    new_watermark = {"start": str(tail[0][3]), "skip": ties, "tail": [_row_key(row) for row in tail]}
+    return columns, new_watermark
+
 
 def get_interaction_data():
+    """
+    Extracts the interactions added since the last run and appends them to the ones stored in Redis; all of them are extracted again on the first run, every interaction_full_extraction_interval seconds, or once the watermark is deleted from Redis.
+
+    return: a dictionary with the "org_id", "asset_id" and "score" columns of all interactions, as arrays
+    """
     try:
         connection = psycopg2.connect(user=os.getenv("user"),
             password=os.getenv("password"),
@@ -26,39 +122,31 @@ def get_interaction_data():
             database=os.getenv("database"))
 
         logger.info("Succesfully Connected to Database")
-        cursor = connection.cursor()
-        # we assume that the interactions are stored in a database
-        postgreSQL_select_Query = "select * from --"
-        cursor.execute(postgreSQL_select_Query)
-        mobile_records = cursor.fetchall()
-
-        if(len(mobile_records) == 0):
-            logger.warning("No Database Records!")
-
-        logger.debug("Database results length: " + str(len(mobile_records)))
-
-        user_inter_dict = {}
-        org_id = []
-        asset_id = []
-        score = []
-
-        for row in mobile_records:
-            org_id.append(row[0])
-            asset_id.append(row[1])
-            score.append(row[2])
 
-        user_inter_dict["org_id"] = org_id
-        user_inter_dict["asset_id"] = asset_id
-        user_inter_dict["score"] = score
+        watermark = interaction_store.load_watermark()
+        if watermark is not None and interaction_full_extraction_interval > 0 and \
+                time.time() - watermark.get("full_extraction", 0) >= interaction_full_extraction_interval:
+            logger.info("Extracting all interactions again")
+            watermark = None
 
-        logger.debug(user_inter_dict)
+        # we assume that the interactions are stored in a database
+        new_records, new_watermark = fetch_interactions(connection, watermark)
+        connection.close()
 
-        conn.set("user-interaction", json.dumps(user_inter_dict))
+        logger.debug("New database results length: " + str(len(new_records["org_id"])))
+        if new_watermark is None:
+            logger.warning("No Database Records!")
+            return interaction_store.empty()
+        if len(new_records["org_id"]) == 0:
+            logger.info("No new interactions since the last run")
+            return interaction_store.load()
 
-        with open('/code/src/models_training/interaction_size', 'w') as f:
-            f.write(str(len(user_inter_dict["org_id"])))
+        new_watermark["full_extraction"] = time.time() if watermark is None else watermark["full_extraction"]
+        # only the new interactions are encoded and sent, as new chunks
+        interaction_store.append(new_records, new_watermark, replace=watermark is None)
+        user_inter_dict = interaction_store.load()
 
-        connection.close()
+        generations.write_text('interaction_size', str(len(user_inter_dict["org_id"])))
 
         return user_inter_dict
 
@@ -124,7 +212,17 @@ def get_organizations():
         return None
 
 
-#
-get_interaction_data()
-get_data_assets()
-get_organizations()
+def main():
+    """
+    Retrieves the interactions, the data assets and the organizations and stores them in Redis.
+
+    return: a dictionary with the retrieved "user-interaction", "data-assets" and "organizations"
+    """
+    return {"user-interaction": get_interaction_data(),
+            "data-assets": get_data_assets(),
+            "organizations": get_organizations()}
+
+
+if __name__ == "__main__":
+    with generations.new_generation():
+        main()
@@ -8,6 +8,9 @@ from surprise import Reader
 from surprise import dump
 import redis
 import json
+import generations
+from models_training import incremental_training
+from models_training import interaction_store
 
 logFormatter = '%(asctime)s - %(levelname)s - %(message)s'
 logging.basicConfig(format=logFormatter, level=logging.INFO)
@@ -17,9 +20,20 @@ conn = redis.Redis('redis')
 
 debug = False
 
+# the name of the model dump in the artifact generations
+model_dump = "user_base_model_dump"
 
-def data_extraction():
-    user_inter_dict = json.loads(conn.get("user-interaction"))
+sim_options = {'name': 'cosine',
+               'user_based': True  # compute  similarities between users
+               }
+
+
+def data_extraction(user_inter_dict=None):
+    """
+    Builds the Surprise dataset of the interactions, read from Redis unless they are given.
+    """
+    if user_inter_dict is None:
+        user_inter_dict = interaction_store.load()
     logger.debug(user_inter_dict)
     if (user_inter_dict is None or len(user_inter_dict["org_id"]) == 0):
         logger.warning("No available interaction data!")
@@ -32,29 +46,45 @@ def data_extraction():
     return data
 
 
-def model_training(data):
-    sim_options = {'name': 'cosine',
-                    'user_based': True  # compute  similarities between items
-                    }
-    algo_user = KNNBaseline(sim_options=sim_options)
+def model_training(data, interactions_fingerprint=None):
     trainset = data.build_full_trainset()
-    algo_user.fit(trainset)
+    algo_user = incremental_training.fit(KNNBaseline(sim_options=sim_options), trainset, generations.path(model_dump))
+    save_model(algo_user, interactions_fingerprint)
+
+    return algo_user
+
 
+def save_model(algo_user, interactions_fingerprint=None):
+    """
+    Dumps the fitted model to disk along with its ratings for incremental training and the fingerprint of the interactions it was trained on.
+    """
     try:
-        if (debug):
-            dump.dump("./src/models_training/user_base_model_dump", algo= algo_user)
-        else:
-            dump.dump("/code/src/models_training/user_base_model_dump", algo= algo_user)
+        # dumped next to the file and renamed over it, as the file may be shared with the previous generation
+        with generations.writing(model_dump) as tmp_path:
+            dump.dump(tmp_path, algo=algo_user)
+        incremental_training.write_ratings(generations.path(model_dump), algo_user)
+        if interactions_fingerprint is not None:
+            incremental_training.write_fingerprint(generations.path(model_dump), interactions_fingerprint)
         logger.info("User-based model successfully dump to disk")
     except OSError as err:
         logger.error("While writing user-based model to file: {0}".format(err))
 
 
-def main():
-    model_data = data_extraction()
+def main(user_inter_dict=None):
+    if user_inter_dict is None:
+        user_inter_dict = interaction_store.load()
+    model_data = data_extraction(user_inter_dict)
     if(model_data is None):
         return None
-    model_training(model_data)
+    # the previous model is still valid if the interactions have not changed
+    interactions_fingerprint = incremental_training.fingerprint(user_inter_dict)
+    algo_user = incremental_training.load_if_unchanged(generations.path(model_dump), interactions_fingerprint)
+    if algo_user is not None:
+        logger.info("Interactions unchanged, user-based model reused")
+        return algo_user
+    return model_training(model_data, interactions_fingerprint)
 
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    with generations.new_generation():
+        main()
@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+
+from models_training import retrieve_data
+from models_training import cf_models
+from models_scoring import semantic_scoring
+from models_scoring import item_based_scoring
+from models_scoring import user_based_scoring
+import hybrid_recommendations
+import generations
+import profiling
+
+load_dotenv()
+
+logFormatter = '%(asctime)s - %(levelname)s - %(message)s'
+logging.basicConfig(format=logFormatter, level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# stages running at the same time; the semantic branch is independent of the collaborative filtering one
+pipeline_workers = int(os.getenv("pipeline_workers", "3"))
+
+
+def _retrieved(results, key):
+    retrieved = results.get("retrieve_data")
+    if retrieved is None:
+        return None
+    return retrieved[key]
+
+
+def _semantic_scoring(results):
+    return semantic_scoring.semantic_scoring(_retrieved(results, "organizations"))
+
+
+def _cf_models(results):
+    return cf_models.main(_retrieved(results, "user-interaction"))
+
+
+def _cf_model(results, n):
+    models = results.get("cf_models")
+    if models is None:
+        return None
+    return models[n]
+
+
+def _item_based_scoring(results):
+    return item_based_scoring.model_prediction(_cf_model(results, 0),
+                                               _retrieved(results, "data-assets"),
+                                               _retrieved(results, "organizations"))
+
+
+def _user_based_scoring(results):
+    return user_based_scoring.model_prediction(_cf_model(results, 1),
+                                               _retrieved(results, "data-assets"),
+                                               _retrieved(results, "organizations"))
+
+
+def _hybrid_recommendations(results):
+    scorings = {name: results.get(name)
+                for name in ("semantic_scoring", "item_based_scoring", "user_based_scoring")}
+    return hybrid_recommendations.generate_recommendation(_retrieved(results, "organizations"),
+                                                          _retrieved(results, "data-assets"),
+                                                          scorings)
+
+
+# stage name -> (stages it depends on, function receiving the results of the finished stages)
+STAGES = {
+    "retrieve_data": ((), lambda results: retrieve_data.main()),
+    "semantic_scoring": (("retrieve_data",), _semantic_scoring),
+    "cf_models": (("retrieve_data",), _cf_models),
+    "item_based_scoring": (("retrieve_data", "cf_models"), _item_based_scoring),
+    "user_based_scoring": (("retrieve_data", "cf_models"), _user_based_scoring),
+    "hybrid_recommendations": (("retrieve_data", "semantic_scoring", "item_based_scoring", "user_based_scoring"),
+                               _hybrid_recommendations),
+}
+
+
+def _timed(name, function, results, profile_run=None):
+    """
+    Runs a stage, under the profiler if a profiled run directory is given.
+
+    return: the output of the stage (None if it failed), its wall time in seconds, its profiling stats (None if not profiled or failed) and whether it failed
+    """
+    start = time.perf_counter()
+    stats = None
+    failed = False
+    try:
+        if profile_run is None:
+            output = function(results)
+        else:
+            output, stats = profiling.profile_stage(profile_run, name, function, results)
+    except Exception as err:
+        logger.error(f'Stage {name} failed: {err}')
+        output = None
+        failed = True
+    seconds = time.perf_counter() - start
+    logger.info(f'Stage {name} finished in {seconds:.2f}s')
+    return output, seconds, stats, failed
+
+
+def run(stages=None, workers=None):
+    """
+    Runs the given pipeline stages (all by default) in one process, each one as soon as the stages it depends on have finished, and passes their outputs in memory.
+
+    The stages write their files to a new artifact generation, which starts from the files of the current one and becomes the current one once all stages have succeeded (see generations.py).
+
+    With pipeline_profile_dir set, the stages are profiled one at a time (see profiling.py).
+
+    A dependency that is not among the given stages is not run; the stage then reads that input from Redis or disk, as when run on its own. When a stage fails, the stages depending on it are skipped, the others run to the end, and the generation is dropped: the current one stays in place.
+
+    param stages: a list of stage names
+    param workers: the number of stages running at the same time
+
+    return: a dictionary with the stage names as keys and their wall times in seconds as values
+
+    raises RuntimeError: if a stage failed
+    """
+    if stages is None:
+        stages = list(STAGES)
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise ValueError(f'Unknown pipeline stages: {unknown}')
+    if workers is None:
+        workers = pipeline_workers
+    profile_run = None
+    if profiling.enabled():
+        profile_run = profiling.start_run()
+        # the peak memory of a stage is only its own if no other stage runs meanwhile
+        workers = 1
+
+    selected = set(stages)
+    pending = [name for name in STAGES if name in selected]
+    results = {}
+    timings = {}
+    profiles = {}
+    running = {}
+    failed = []
+    skipped = []
+    start = time.perf_counter()
+    try:
+        with generations.new_generation({"stages": stages}) as manifest_metadata:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stage") as pool:
+                while pending or running:
+                    for name in list(pending):
+                        dependencies = STAGES[name][0]
+                        if any(d in failed or d in skipped for d in dependencies):
+                            pending.remove(name)
+                            skipped.append(name)
+                            logger.warning(f'Stage {name} skipped')
+                        elif all(d in results or d not in selected for d in dependencies):
+                            pending.remove(name)
+                            logger.info(f'Stage {name} started')
+                            running[pool.submit(_timed, name, STAGES[name][1], dict(results), profile_run)] = name
+                    if not running:
+                        continue
+                    done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        output, timings[name], stats, stage_failed = future.result()
+                        if stage_failed:
+                            failed.append(name)
+                        else:
+                            results[name] = output
+                        if stats is not None:
+                            profiles[name] = stats
+            if failed:
+                # leaving the block with an exception drops the generation
+                raise RuntimeError(f'Pipeline failed: stages {failed} failed, {skipped} skipped')
+            manifest_metadata["seconds"] = timings
+    finally:
+        logger.info(f'Pipeline finished in {time.perf_counter() - start:.2f}s')
+        for name, seconds in timings.items():
+            logger.info(f'  {name}: {seconds:.2f}s')
+        if profile_run is not None:
+            profiling.write_summary(profile_run, profiles)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the recommender training pipeline in a single process.")
+    parser.add_argument("--stages", help="comma separated stages to run (default: all): " + ", ".join(STAGES))
+    parser.add_argument("--workers", type=int, default=pipeline_workers,
+                        help="number of stages running at the same time")
+    args = parser.parse_args(argv)
+    stages = args.stages.split(",") if args.stages else None
+    run(stages, args.workers)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import logging
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# Profiling of the pipeline stages, enabled by setting pipeline_profile_dir. Every run gets its own directory in it:
+#   <stage>.prof   the cProfile statistics of the stage, to open with pstats or snakeviz
+#   <stage>.txt    its most expensive functions
+#   summary.json   wall time, peak traced memory and most expensive functions of every stage
+#   summary.txt    the same compared with the previous run
+profile_dir = os.getenv("pipeline_profile_dir", "")
+# functions kept per stage in the summaries
+profile_top = int(os.getenv("pipeline_profile_top", "25"))
+
+
+def enabled():
+    return profile_dir != ""
+
+
+def _runs():
+    """
+    return: the run directories, oldest first
+    """
+    if not os.path.isdir(profile_dir):
+        return []
+    return sorted(entry.path for entry in os.scandir(profile_dir) if entry.is_dir())
+
+
+def start_run():
+    """
+    Creates the directory of a new profiled run.
+
+    return: its path
+    """
+    run_dir = os.path.join(profile_dir, time.strftime("%Y%m%d-%H%M%S"))
+    suffix = 1
+    while os.path.exists(run_dir):
+        suffix += 1
+        run_dir = os.path.join(profile_dir, time.strftime("%Y%m%d-%H%M%S") + f"-{suffix}")
+    os.makedirs(run_dir)
+    logger.info(f'Profiling the pipeline into {run_dir}')
+    return run_dir
+
+
+def _top_functions(stats):
+    """
+    return: the profile_top functions with the largest cumulative time, as dictionaries
+    """
+    rows = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({function})",
+                     "calls": calls, "tottime": tottime, "cumtime": cumtime})
+    rows.sort(key=lambda row: row["cumtime"], reverse=True)
+    return rows[:profile_top]
+
+
+def profile_stage(run_dir, name, function, *args):
+    """
+    Runs a stage function under cProfile and tracemalloc and writes its profile to the run directory.
+
+    cProfile only sees the calling thread, so the work a stage hands to thread or process pools (preferences downloads, parallel model fits) is not broken down; tracemalloc sees the whole process, so the stages must not run concurrently.
+
+    return: the output of the function and the stats of the stage (wall time, peak traced memory, most expensive functions)
+    """
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        output = function(*args)
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        profiler.dump_stats(os.path.join(run_dir, name + ".prof"))
+        with open(os.path.join(run_dir, name + ".txt"), "w") as f:
+            stats = pstats.Stats(profiler, stream=f)
+            stats.sort_stats("cumulative").print_stats(profile_top)
+        stage_stats = {"seconds": seconds, "peak_memory": peak_memory, "functions": _top_functions(stats)}
+    return output, stage_stats
+
+
+def _change(current, previous):
+    if previous is None:
+        return "new"
+    if previous == 0:
+        return "n/a"
+    return f"{100 * (current - previous) / previous:+.0f}%"
+
+
+def compare(summary, previous):
+    """
+    return: the lines of a report comparing the stages and functions of a run with those of the previous one
+    """
+    lines = [f"{'stage':<24}{'seconds':>10}{'change':>9}{'peak MiB':>11}{'change':>9}"]
+    for name, stage in summary.items():
+        before = previous.get(name, {})
+        lines.append(f"{name:<24}{stage['seconds']:>10.2f}{_change(stage['seconds'], before.get('seconds')):>9}"
+                     f"{stage['peak_memory'] / 2 ** 20:>11.1f}"
+                     f"{_change(stage['peak_memory'], before.get('peak_memory')):>9}")
+    for name, stage in summary.items():
+        before = {row["function"]: row["cumtime"] for row in previous.get(name, {}).get("functions", [])}
+        lines.append("")
+        lines.append(f"{name}: most expensive functions (cumulative seconds)")
+        for row in stage["functions"]:
+            lines.append(f"  {row['cumtime']:>9.3f}{_change(row['cumtime'], before.get(row['function'])):>9}"
+                         f"  {row['calls']:>9}  {row['function']}")
+    return lines
+
+
+def write_summary(run_dir, summary):
+    """
+    Writes the summary of a run and its comparison with the previous run, which is also logged.
+
+    param summary: a dictionary with the stage names as keys and their stats (from profile_stage) as values
+    """
+    previous = {}
+    runs = _runs()
+    if run_dir in runs and runs.index(run_dir) > 0:
+        previous_run = runs[runs.index(run_dir) - 1]
+        try:
+            with open(os.path.join(previous_run, "summary.json")) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            logger.warning(f'No summary to compare with in {previous_run}')
+
+    with open(os.path.join(run_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    lines = compare(summary, previous)
+    with open(os.path.join(run_dir, "summary.txt"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    logger.info("Profiling summary:\n" + "\n".join(lines[:len(summary) + 1]))
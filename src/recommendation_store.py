@@ -0,0 +1,183 @@
+import os
+import json
+import logging
+import threading
+import redis
+
+logger = logging.getLogger(__name__)
+
+# The recommendations are published to Redis as:
+#   recommendations:<generation>  a hash with the organization IDs as fields and their JSON [[data asset ID, score], ...] as values
+#   recommendations:current       the generation served, switched only when the artifact generation recording it
+#                                 becomes the current one (see generations.py)
+#   recommendations:generation    the counter numbering the generations
+# The hashes of the artifact generations still on disk are kept, so that a rollback serves their recommendations again.
+CURRENT_KEY = "recommendations:current"
+GENERATION_KEY = "recommendations:generation"
+
+# best recommendations published per organization, enough to survive the exclusion filters and feed the contextual
+# recommendations (0 publishes them all)
+recommendations_publish_top_n = int(os.getenv("recommendations_publish_top_n", "1000"))
+# organizations written per HSET while publishing
+recommendations_publish_batch = int(os.getenv("recommendations_publish_batch", "1000"))
+
+# short timeouts, so that the API falls back to the local file instead of hanging when Redis is down
+conn = redis.Redis('redis',
+                   socket_connect_timeout=float(os.getenv("redis_connect_timeout", "0.5")),
+                   socket_timeout=float(os.getenv("redis_timeout", "1")))
+
+# the generation the API reads, None when Redis holds no recommendations or cannot be reached
+_generation = None
+_refresher = None
+
+
+def generation_key(generation):
+    return f"recommendations:{generation}"
+
+
+def write(table, connection=None):
+    """
+    Writes the recommendations_publish_top_n best recommendations of every organization to a new generation hash, which the API reads once serve() makes it the current one.
+
+    param table: the recommendations score table
+    param connection: the Redis connection to write with, instead of the API's one and its short timeouts
+
+    return: the new generation
+    """
+    if connection is None:
+        connection = conn
+    generation = connection.incr(GENERATION_KEY)
+    key = generation_key(generation)
+    pipe = connection.pipeline(transaction=False)
+    batch = {}
+    limit = recommendations_publish_top_n if recommendations_publish_top_n > 0 else None
+    for org_id in table.row_ids:
+        batch[str(org_id)] = json.dumps(table.entry(org_id, limit))
+        if len(batch) >= recommendations_publish_batch:
+            pipe.hset(key, mapping=batch)
+            batch = {}
+    if batch:
+        pipe.hset(key, mapping=batch)
+    pipe.execute()
+    logger.info(f'Recommendations generation {generation} written: {len(table.row_ids)} organizations')
+    return generation
+
+
+def serve(generation, connection=None):
+    """
+    Makes the API read the given generation, or the recommendations file of the current artifact generation if None.
+    """
+    if connection is None:
+        connection = conn
+    if generation is None:
+        connection.delete(CURRENT_KEY)
+    else:
+        connection.set(CURRENT_KEY, generation)
+    logger.info(f'Recommendations generation served from Redis: {generation}')
+
+
+def delete_generation(generation, connection=None):
+    if connection is None:
+        connection = conn
+    connection.delete(generation_key(generation))
+
+
+def remove_generations(kept, connection=None):
+    """
+    Deletes the generation hashes other than the given ones.
+
+    param kept: the generations to keep
+    """
+    if connection is None:
+        connection = conn
+    kept = set(str(generation) for generation in kept)
+    stale = []
+    for key in connection.scan_iter(match=generation_key("*")):
+        generation = key.decode()[len(generation_key("")):]
+        if generation.isdigit() and generation not in kept:
+            stale.append(key)
+    if stale:
+        connection.delete(*stale)
+        logger.info(f'{len(stale)} recommendations generations removed from Redis')
+
+
+def refresh():
+    """
+    Reads which generation is current.
+
+    return: True if it could be read; False otherwise
+    """
+    global _generation
+    try:
+        generation = conn.get(CURRENT_KEY)
+    except redis.RedisError as err:
+        logger.warning(f'Recommendations generation cannot be read from Redis: {err}')
+        _generation = None
+        return False
+    _generation = generation.decode() if generation is not None else None
+    return True
+
+
+def lookup(org_id, fallback_org_id="1"):
+    """
+    Reads the recommendations of an organization, or those of the fallback organization if it has none, from the current generation with a single HMGET.
+
+    return: a list of [data asset ID, score], or None if the recommendations are not available from Redis
+    """
+    return lookup_many([org_id], fallback_org_id)[str(org_id)]
+
+
+def lookup_many(org_ids, fallback_org_id="1"):
+    """
+    Reads the recommendations of several organizations, each one falling back to those of the fallback organization if it has none, from the current generation with a single HMGET.
+
+    return: a dictionary with the organization IDs (as strings) as keys and lists of [data asset ID, score] as values, None for those whose recommendations are not available from Redis
+    """
+    fields = [str(org_id) for org_id in org_ids]
+    unavailable = dict.fromkeys(fields)
+    generation = _generation
+    if generation is None:
+        return unavailable
+    try:
+        *recommendations, fallback = conn.hmget(generation_key(generation), *fields, fallback_org_id)
+    except redis.RedisError as err:
+        logger.warning(f'Recommendations cannot be read from Redis: {err}')
+        return unavailable
+    if fallback is None and all(recommendation is None for recommendation in recommendations):
+        # the generation was replaced and has been removed since the last refresh
+        refresh()
+        return unavailable
+    parsed = {}
+    for field, recommendation in zip(fields, recommendations):
+        if recommendation is None:
+            recommendation = fallback
+        parsed[field] = json.loads(recommendation) if recommendation is not None else None
+    return parsed
+
+
+def _refresh_loop(interval, stop_event):
+    while True:
+        refresh()
+        if stop_event.wait(interval):
+            return
+
+
+def start_refresher(interval):
+    """
+    Starts a daemon thread reading the current generation every `interval` seconds, which bounds how long the API serves a replaced one.
+    """
+    global _refresher
+    if _refresher is not None and _refresher[0].is_alive():
+        return
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_refresh_loop, args=(interval, stop_event),
+                              name="recommendation-generation", daemon=True)
+    thread.start()
+    _refresher = (thread, stop_event)
+
+
+def stop_refresher():
+    global _refresher
+    if _refresher is not None:
+        _refresher[1].set()
+        _refresher = None
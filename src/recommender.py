@@ -1,20 +1,35 @@
 import os
 import json
+import time
+import hashlib
+import itertools
 import requests
 import sys
 import logging
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import HTTPError
-from surprise import dump
 from flask import request
+from flask import g
+from flask import Response
 from flask import jsonify
 from flask_api import FlaskAPI
 from flask_api import exceptions
 from flask import redirect, url_for
 from dotenv import load_dotenv
+import artifact_store
+import exclusion_cache
+import http_client
+import generations
+import live_catalog
+import metrics
+import recommendation_store
+import score_table
+from ttl_cache import TTLCache
 load_dotenv()
 
 logFormatter = '%(asctime)s - %(levelname)s - %(message)s'
-logging.basicConfig(format=logFormatter, level=logging.DEBUG)
+logging.basicConfig(format=logFormatter, level=os.getenv("log_level", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Create the application instance
@@ -24,48 +39,88 @@ app = FlaskAPI(__name__)
 debug = False
 debugauth = False  # FALSE ON PRODUCTION
 
+# seconds between checks for new recommendation artifacts on disk
+artifact_reload_interval = float(os.getenv("artifact_reload_interval", "30"))
+# seconds between refreshes of the non-deleted data assets, i.e. their maximum staleness
+catalog_refresh_interval = float(os.getenv("catalog_refresh_interval", "60"))
+# seconds between checks of which recommendations generation Redis serves
+recommendation_generation_refresh_interval = float(os.getenv("recommendation_generation_refresh_interval", "10"))
+# seconds between reads of the exclusion cache invalidations published by the other processes
+exclusion_invalidation_sync_interval = float(os.getenv("exclusion_invalidation_sync_interval", "2"))
+
+# shared by all requests to run the upstream exclusion filters concurrently
+filter_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("upstream_workers", "16")), thread_name_prefix="upstream")
+# runs those of the batch requests instead, so that single requests do not queue behind a whole batch
+batch_filter_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("batch_upstream_workers", "4")), thread_name_prefix="batch-upstream")
+
+# validated session cookies (hashed) -> authentication result
+auth_cache = TTLCache(max_size=int(os.getenv("auth_cache_size", "10000")),
+                      ttl=float(os.getenv("auth_cache_ttl", "60")))
+auth_cache_negative_ttl = float(os.getenv("auth_cache_negative_ttl", "10"))
+
+batch_max_orgs = int(os.getenv("batch_max_orgs", "1000"))
+
+# weight of the similarity to the viewed data assets against the organization's recommendations (0 ignores them)
+contextual_weight = float(os.getenv("contextual_weight", "0.3"))
+# viewed data assets whose neighbors are taken into account, the first ones of the request
+contextual_max_datasets = int(os.getenv("contextual_max_datasets", "10"))
+# best recommendations of the organization the neighbors are blended with
+contextual_candidates = int(os.getenv("contextual_candidates", "1000"))
+
+# data assets returned per organization
+max_recommended = 10
+
 
 def test():
     print(test)
 
 
+@metrics.STAGE_LATENCY.labels("recommendations").time()
 def get_recommendations(org_id):
-
+    """
+    return: an iterator over the [data asset ID, score] of the recommendations of the organization (or of organization "1" if it has none), best first; the local table is walked lazily
+    """
     logger.debug("Trying to retrieve recommendations")
 
-    try:
-        if(debug):
-            with open('./src/recommendations') as f:
-                recommendation = json.load(f)
-        else:
-            with open('/code/src/recommendations') as f:
-                recommendation = json.load(f)
-    except OSError as err:
-        logger.critical('While reading recommendations: {0}'.format(err))
+    return _iter_recommendations(org_id, recommendation_store.lookup(org_id))
 
-    try:
-        recommendation_user = recommendation[org_id]
-    except:
-        recommendation_user = recommendation["1"]
+
+@metrics.STAGE_LATENCY.labels("recommendations").time()
+def get_many_recommendations(org_ids):
+    """
+    return: a dictionary with the given organization IDs as keys and iterators as returned by get_recommendations as values; the recommendations of all of them are read from Redis with a single request
+    """
+    logger.debug(f"Trying to retrieve the recommendations of {len(org_ids)} organizations")
+
+    stored = recommendation_store.lookup_many(org_ids)
+    return {org_id: _iter_recommendations(org_id, stored[str(org_id)]) for org_id in org_ids}
+
+
+def _iter_recommendations(org_id, recommendation_user):
+    metrics.CACHE_LOOKUPS.labels("recommendations_redis", "miss" if recommendation_user is None else "hit").inc()
+    if recommendation_user is None:
+        # Redis holds no recommendations or cannot be reached, the local file is used instead
+        recommendation = artifact_store.get("recommendations")
+        return recommendation.iter_entries(org_id if org_id in recommendation else "1")
 
     logger.debug("Recommendations successfully retrieved!")
 
-    return recommendation_user
+    return iter(recommendation_user)
 
 
-def get_dataset_info(recommended_dataset_ids):
+@metrics.STAGE_LATENCY.labels("dataset_info").time()
+def get_dataset_info(recommended_dataset_ids, limit=None):
+    """
+    param recommended_dataset_ids: an iterable of data assets IDs, consumed only until `limit` data assets are found
+    param limit: the maximum number of data assets returned, None for no maximum
 
+    return: a list of dictionaries with the information of the given data assets, in the given order
+    """
     logger.debug("Trying to retrieve datasets information")
 
-    try:
-        if(debug):
-            with open('./src/models_scoring/datasets_info') as f:
-                dataset_info = json.load(f)
-        else:
-            with open('/code/src/models_scoring/datasets_info') as f:
-                dataset_info = json.load(f)
-    except OSError as err:
-        logger.critical('While reading datasets information: {0}'.format(err))
+    dataset_info = artifact_store.get("datasets_info")
 
     recommended_datasets = []
     for dataset_id in recommended_dataset_ids:
@@ -76,175 +131,336 @@ def get_dataset_info(recommended_dataset_ids):
             logger.warning(
                 f"Dataset's ({dataset_id}) information cannot be retrieved")
             continue
+        if limit is not None and len(recommended_datasets) >= limit:
+            break
 
     logger.debug("Dataset's information successfully retrieved!")
 
     return recommended_datasets
 
 
+def load_artifacts():
+    """
+    Parses the recommendation artifacts of the current generation once and keeps them resident in memory; a background thread reloads them whenever the pipeline commits a new generation or one is rolled back to.
+    """
+    generations.debug = debug
+    artifact_store.register("recommendations", score_table.index_path(generations.current_path('recommendations')),
+                            loader=score_table.load_from_index, default=score_table.ScoreTable.empty())
+    artifact_store.register("datasets_info", generations.current_path('datasets_info'), default={})
+    artifact_store.register("item_neighbors", generations.current_path('item_neighbors'), default={})
+
+
+def start_background_tasks():
+    """
+    Starts the threads keeping the in-memory artifacts, the live catalog, the served recommendations generation and the exclusion cache up to date; the artifacts rewritten since they were loaded are reloaded first.
+    """
+    artifact_store.reload_all()
+    artifact_store.start_reloader(artifact_reload_interval)
+    live_catalog.start_refresher(catalog_refresh_interval)
+    recommendation_store.start_refresher(recommendation_generation_refresh_interval)
+    exclusion_cache.start_syncer(exclusion_invalidation_sync_interval)
+
+
 ###########################################################
-def datasets_not_owned(org_id, dataset_ids):
+@metrics.STAGE_LATENCY.labels("filter_owned").time()
+def get_owned_datasets(org_id):
     """
-    This function is responsible to retrieve the IDs of all data assets that a given organization owns or purchased and exclude them from the given recommended list.
+    This function is responsible to retrieve the IDs of all data assets that a given organization owns or purchased, which are excluded from its recommendations; they are cached for exclusion_cache_ttl seconds or until invalidated.
 
     param org_id: a string containing the target user's organization ID
-    param datasets_id: a list of data assets IDs
 
-    return: a list of a list of data assets IDs
+    return: a frozenset of data assets IDs, or None if they cannot be retrieved (then nothing is recommended)
     """
-    logger.debug("Trying to exclude owned datasets")
+    logger.debug("Trying to retrieve owned datasets")
 
     prefix = "http://" + os.getenv("icarus_internal")
     path = prefix + str(org_id)
+    fetched_at = time.monotonic()
     try:
-        data = requests.get(path).json()
+        data = http_client.get(path).json()
         if 'status' in data:
             if data['status'] != 200:
-                return dataset_ids
+                metrics.UPSTREAM_ERRORS.labels("owned").inc()
+                return frozenset()
     except HTTPError as http_err:
         logger.error(f'HTTP error occurred: {http_err}')
-        return []
+        metrics.UPSTREAM_ERRORS.labels("owned").inc()
+        return None
     except Exception as err:
         logger.error(f'Other error occurred: {err}')
-        return []
+        metrics.UPSTREAM_ERRORS.labels("owned").inc()
+        return None
     # checking for bad responses
-    owned = set()
-    for i in range(len(data)):
-        if 'id' not in data[i]:
-            continue
-        owned.add(data[i]['id'])
-    dataset_ids = [x for x in dataset_ids if x not in list(owned)]
+    owned = frozenset(data[i]['id'] for i in range(len(data)) if 'id' in data[i])
+    exclusion_cache.store("owned", org_id, owned, fetched_at)
 
-    logger.debug('Owned Datasets successfully excluded')
-    logger.debug(f'List: {dataset_ids}')
+    logger.debug('Owned Datasets successfully retrieved')
 
-    return dataset_ids
+    return owned
 
 ###########################################################
 
 
-def datasets_not_visible(org_id, dataset_ids):
+@metrics.STAGE_LATENCY.labels("filter_not_visible").time()
+def get_not_visible_datasets(org_id):
     """
-    This function is responsible to retrieve the IDs of all data assets that a given organization owns or purchased and exclude them from the given recommended list.
+    This function is responsible to retrieve the IDs of all data assets that a given organization cannot see, which are excluded from its recommendations; they are cached for exclusion_cache_ttl seconds or until invalidated.
 
     param org_id: a string containing the target user's organization ID
-    param datasets_id: a list of data assets IDs
 
-    return: a list of a list of data assets IDs
+    return: a frozenset of data assets IDs, or None if they cannot be retrieved (then nothing is recommended)
     """
-    logger.debug("Trying to exclude owned datasets")
+    logger.debug("Trying to retrieve not visible datasets")
 
     prefix = "http://" + os.getenv("icarus_internal")
     path = prefix + str(org_id)
+    fetched_at = time.monotonic()
     try:
-        data = requests.get(path).json()
+        data = http_client.get(path).json()
         if 'status' in data:
             if data['status'] != 200:
-                return dataset_ids
+                metrics.UPSTREAM_ERRORS.labels("not_visible").inc()
+                return frozenset()
     except HTTPError as http_err:
         logger.error(f'HTTP error occurred: {http_err}')
-        return []
+        metrics.UPSTREAM_ERRORS.labels("not_visible").inc()
+        return None
     except Exception as err:
         logger.error(f'Other error occurred: {err}')
-        return []
+        metrics.UPSTREAM_ERRORS.labels("not_visible").inc()
+        return None
     # checking for bad responses
-    logger.debug(f'Not visible data assets for org {org_id}: {data}')
+    not_visible = frozenset(data)
+    exclusion_cache.store("not_visible", org_id, not_visible, fetched_at)
+
+    logger.debug('Not visible Datasets successfully retrieved')
 
-    dataset_ids = [x for x in dataset_ids if x not in list(data)]
+    return not_visible
 
-    logger.debug('Not visible Datasets successfully excluded')
-    logger.debug(f'List: {dataset_ids}')
 
-    return dataset_ids
+# the sets of data assets excluded per organization besides the deleted ones, by exclusion cache kind
+EXCLUSION_SOURCES = {"owned": get_owned_datasets, "not_visible": get_not_visible_datasets}
 
 
-def remove_deleted_datasets(dataset_ids):
+def exclude_datasets(dataset_ids, excluded):
     """
-    This function is responsible to retrieve the IDs of all data assets that a given organization owns or purchased and exclude them from the given recommended list.
+    This function is responsible to exclude the deleted data assets (using the periodically refreshed live catalog) and the given excluded ones from the recommended data assets, lazily: the data assets are only checked as they are consumed.
+
+    param dataset_ids: an iterable of data assets IDs
+    param excluded: a list of sets of data assets IDs as returned by collect_exclusion_filters, None to exclude all
+
+    return: an iterator over the kept data assets IDs, in the given order
+    """
+    live_assets = live_catalog.live_assets()
+    if live_assets is None:
+        logger.error('Live catalog is not available')
+        metrics.UPSTREAM_ERRORS.labels("live_catalog").inc()
+        return
+    if excluded is None:
+        return
+    for dataset_id in dataset_ids:
+        if dataset_id not in live_assets:
+            continue
+        for exclusion in excluded:
+            if dataset_id in exclusion:
+                break
+        else:
+            yield dataset_id
+
+
+def submit_exclusion_filters(org_id, pool=filter_pool):
+    """
+    Gathers the owned and not visible data assets of the organization: from the exclusion cache, or else from ICARUS in the background, so that the upstream calls overlap.
 
     param org_id: a string containing the target user's organization ID
-    param datasets_id: a list of data assets IDs
+    param pool: the thread pool running the upstream calls
 
-    return: a list of a list of data assets IDs
+    return: the exclusion sets (or futures of them)
     """
-    logger.debug("Trying to exclude deleted datasets")
+    exclusions = []
+    for kind, get_datasets in EXCLUSION_SOURCES.items():
+        cached = exclusion_cache.lookup(kind, org_id)
+        metrics.CACHE_LOOKUPS.labels("exclusions_" + kind, "miss" if cached is None else "hit").inc()
+        exclusions.append(cached if cached is not None else pool.submit(get_datasets, org_id))
+    return exclusions
 
-    prefix = "http://" + os.getenv("icarus_internal")
-    path = prefix
-    try:
-        data = requests.get(path).json()
-        if 'status' in data:
-            if data['status'] != 200:
-                return dataset_ids
-    except HTTPError as http_err:
-        logger.error(f'HTTP error occurred: {http_err}')
-        return []
-    except Exception as err:
-        logger.error(f'Other error occurred: {err}')
-        return []
-    # checking for bad responses
-    logger.debug(f'Not deleted data assets {data}')
 
-    dataset_ids = [x for x in dataset_ids if x in list(data)]
-    deleted_dataset_ids = [x for x in dataset_ids if x not in list(data)]
+def collect_exclusion_filters(exclusions):
+    """
+    Waits for the exclusion sets gathered by submit_exclusion_filters.
 
-    logger.debug(f'Deleted data assets: {deleted_dataset_ids}')
+    return: a list of sets of data assets IDs, None if one of them could not be retrieved (then nothing is recommended)
+    """
+    excluded = []
+    for exclusion in exclusions:
+        if isinstance(exclusion, Future):
+            exclusion = exclusion.result()
+        if exclusion is None:
+            return None
+        excluded.append(exclusion)
+    return excluded
+
+###########################################################
+@metrics.STAGE_LATENCY.labels("contextual").time()
+def contextual_recommendations(recommendations, datasets_id):
+    """
+    This function blends the recommendations of an organization with the data assets most similar to those the user is viewing, looked up in the neighbor table precomputed by the item-based model.
 
-    logger.debug('Deleted Datasets successfully excluded')
-    logger.debug(f'List: {dataset_ids}')
+    A data asset's blended score is (1 - contextual_weight) times its recommendation score, rescaled to [0, 1] over the list, plus contextual_weight times its highest similarity to a viewed data asset; the viewed data assets themselves are left out. IDs are compared as strings, whether they are given as strings or integers.
+
+    param recommendations: a list of [data asset ID, score] in descending score order
+    param datasets_id: a list of data assets IDs
+
+    return: a list of data assets IDs in descending blended score order
+    """
+    viewed = set(str(x) for x in datasets_id[:contextual_max_datasets])
+    if not viewed:
+        return [i[0] for i in recommendations]
+
+    neighbor_table = artifact_store.get("item_neighbors")
+    # the highest similarities and the IDs of the neighbors, both keyed by the ID as a string
+    similarity = {}
+    neighbor_ids = {}
+    for dataset_id in viewed:
+        for neighbor_id, neighbor_similarity in neighbor_table.get(dataset_id, []):
+            key = str(neighbor_id)
+            if key not in viewed and neighbor_similarity > similarity.get(key, 0):
+                similarity[key] = neighbor_similarity
+                neighbor_ids[key] = neighbor_id
+
+    dataset_ids = [i[0] for i in recommendations]
+    if recommendations:
+        top, bottom = recommendations[0][1], recommendations[-1][1]
+    else:
+        top, bottom = 1.0, 0.0
+    scale = (1 - contextual_weight) / ((top - bottom) or 1.0)
+
+    # the neighbors and the viewed data assets are taken out of the list, which otherwise keeps its order, and the
+    # neighbors are inserted back where their blended score ranks them; the list is only scanned once
+    skipped = viewed.union(similarity)
+    skipped_positions = [i for i, dataset_id in enumerate(dataset_ids) if str(dataset_id) in skipped]
+    recommended = {}
+    for i in skipped_positions:
+        key = str(dataset_ids[i])
+        recommended[key] = (recommendations[i][1] - bottom) * scale
+        if key in neighbor_ids:
+            # a recommended neighbor keeps the ID it is recommended with
+            neighbor_ids[key] = dataset_ids[i]
+    boosted = sorted(((recommended.get(key, 0.0) + contextual_weight * neighbor_similarity, neighbor_ids[key])
+                      for key, neighbor_similarity in similarity.items()), key=lambda x: x[0], reverse=True)
+
+    insertions = []
+    low = 0
+    for blended, dataset_id in boosted:
+        # binary search for the first recommendation blended lower
+        high = len(recommendations)
+        while low < high:
+            middle = (low + high) // 2
+            if (recommendations[middle][1] - bottom) * scale >= blended:
+                low = middle + 1
+            else:
+                high = middle
+        insertions.append((low, dataset_id))
+
+    ranked = []
+    start = 0
+    next_insertion = 0
+    for skipped_position in skipped_positions + [len(dataset_ids)]:
+        while next_insertion < len(insertions) and insertions[next_insertion][0] <= skipped_position:
+            position, dataset_id = insertions[next_insertion]
+            ranked += dataset_ids[start:position]
+            ranked.append(dataset_id)
+            start = position
+            next_insertion += 1
+        ranked += dataset_ids[start:skipped_position]
+        start = skipped_position + 1
+
+    return ranked
 
-    return dataset_ids
 
 ###########################################################
 
 
-def generate_recommendations(org_id):
+def generate_recommendations(org_id, datasets_id=None):
     """
     This function is responsible to retrieve all information needed from the storage and apply the recommendation models to generate the recommendations.
 
     param org_id: a string containing the target user's organization ID
-    param datasets_id: a list of strings containing the data assets IDs
+    param datasets_id: a list of strings containing the IDs of the data assets the user is viewing, whose most similar data assets are blended into the recommendations
 
     return: a list of dictionaries, containing the recommended data assets along with other information in a descending order (most to less relevant)
     """
-    logger.info("Generating Recommendations!")
+    logger.debug("Generating Recommendations!")
 
+    exclusions = submit_exclusion_filters(org_id)
     recommendations = get_recommendations(org_id)
-    recommended_dataset_ids = [i[0] for i in recommendations]
-    recommended_dataset_ids = datasets_not_owned(
-        org_id, recommended_dataset_ids)
-    recommended_dataset_ids = datasets_not_visible(
-        org_id, recommended_dataset_ids)
-    recommended_dataset_ids = remove_deleted_datasets(recommended_dataset_ids)
-    recommended_datasets = get_dataset_info(recommended_dataset_ids)
+    if datasets_id and contextual_weight > 0:
+        recommended_dataset_ids = contextual_recommendations(
+            list(itertools.islice(recommendations, contextual_candidates)), datasets_id)
+    else:
+        recommended_dataset_ids = (i[0] for i in recommendations)
+    # the ranked data assets are only walked until enough of them pass the filters
+    recommended_datasets = get_dataset_info(
+        exclude_datasets(recommended_dataset_ids, collect_exclusion_filters(exclusions)), limit=max_recommended)
+
+    # the lists are only formatted for the sampled requests
+    if metrics.sampled():
+        logger.info(f'Recommendations of org {org_id}: '
+                    f'{[dataset.get("dataset_id") for dataset in recommended_datasets]}')
+    logger.debug("Recommendations successfully generated!")
+
+    return recommended_datasets
+
+
+def generate_batch_recommendations(org_ids):
+    """
+    This function generates the recommendations of many organizations at once; their recommendations are read with one Redis request, the deleted data assets are excluded with one shared catalog, and the upstream calls of all organizations run concurrently on the pool kept for the batch requests.
+
+    param org_ids: a list of strings containing organization IDs
+
+    return: a dictionary with the organization IDs as keys and their recommended data assets (as in generate_recommendations) as values
+    """
+    logger.debug(f"Generating Recommendations for {len(org_ids)} organizations!")
+
+    pending = {}
+    for org_id in org_ids:
+        pending[org_id] = submit_exclusion_filters(org_id, batch_filter_pool)
+
+    recommendations = get_many_recommendations(org_ids)
+    batch = {}
+    for org_id, exclusions in pending.items():
+        recommended_dataset_ids = (i[0] for i in recommendations[org_id])
+        batch[org_id] = get_dataset_info(
+            exclude_datasets(recommended_dataset_ids, collect_exclusion_filters(exclusions)), limit=max_recommended)
 
-    logger.info("Recommendations successfully generated!")
+    logger.debug("Batch recommendations successfully generated!")
 
-    return recommended_datasets[:10]
+    return batch
 
 
 ###########################################################
-def generate_recommendations_for_dataset_id(dataset_id):
-    try:
-        if (debug):
-            _, algo_item = dump.load(
-                "./src/models_training/item_base_model_dump")
-        else:
-            _, algo_item = dump.load(
-                "/code/src/models_training/item_base_model_dump")
-    except OSError as err:
-        logger.error('While reading the item based model: {0}'.format(err))
-        return None
+def generate_recommendations_for_dataset_id(dataset_id, org_id):
+    """
+    This function looks up the data assets most similar to a given one in the neighbor table precomputed by the item-based model, excluding those the organization owns or cannot see and the deleted ones.
 
-    dataset_id_str = str(dataset_id)
-    item_inner_id = algo_item.trainset.to_inner_iid(dataset_id_str)
-    neighbors = algo_item.get_neighbors(item_inner_id, k=10)
-    logger.debug(f'Top 10 neighbors of dataset {dataset_id}: {neighbors}')
+    param dataset_id: a data asset ID
+    param org_id: a string containing the target user's organization ID
+
+    return: a list of dictionaries, containing the similar data assets along with other information in a descending order (most to less similar)
+    """
+    exclusions = submit_exclusion_filters(org_id)
+    neighbors = artifact_store.get("item_neighbors").get(str(dataset_id), [])
+    if metrics.sampled():
+        logger.info(f'Neighbors of dataset {dataset_id}: {neighbors}')
 
-    return neighbors
+    similar_dataset_ids = exclude_datasets((i[0] for i in neighbors), collect_exclusion_filters(exclusions))
+    similar_datasets = get_dataset_info(similar_dataset_ids, limit=max_recommended)
+
+    return similar_datasets
 
 
 ###########################################################
+@metrics.STAGE_LATENCY.labels("auth").time()
 def check_authentication(head):
     """
     Checks the authentication when Recommender is called.
@@ -258,20 +474,78 @@ def check_authentication(head):
         cookie = head['Cookie']
     if cookie == "":
         return False
+    # only a digest of the cookie is kept in memory
+    cookie_key = hashlib.sha256(cookie.encode()).hexdigest()
+    cached = auth_cache.get(cookie_key)
+    metrics.CACHE_LOOKUPS.labels("auth", "miss" if cached is None else "hit").inc()
+    if cached is not None:
+        return cached
     URL = os.getenv("icarus_api")
     headers = {'Cookie': cookie}
     try:
-        response = requests.get(url=URL, headers=headers)
-        if response.status_code == 200:
-            return True
+        response = http_client.get(URL, headers=headers)
     except HTTPError as http_err:
         logger.error(f'HTTP error occurred: {http_err}')
+        metrics.UPSTREAM_ERRORS.labels("auth").inc()
         return False
     except Exception as err:
         logger.error(f'Other error occurred: {err}')
+        metrics.UPSTREAM_ERRORS.labels("auth").inc()
+        return False
+    # upstream failures are not cached, only actual answers are
+    if response.status_code == 200:
+        auth_cache.set(cookie_key, True)
+        return True
+    if response.status_code in (401, 403):
+        auth_cache.set(cookie_key, False, ttl=auth_cache_negative_ttl)
         return False
+    logger.error(f'Authentication check failed with status {response.status_code}')
+    metrics.UPSTREAM_ERRORS.labels("auth").inc()
     return False
 ###########################################################
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = getattr(g, "request_start", None)
+    if start is None:
+        return response
+    seconds = time.perf_counter() - start
+    endpoint = request.endpoint or "unknown"
+    metrics.REQUEST_LATENCY.labels(endpoint).observe(seconds)
+    metrics.REQUESTS.labels(endpoint, str(response.status_code)).inc()
+    if seconds > metrics.slow_request_seconds:
+        logger.warning(f'Slow request {request.method} {request.path}: {seconds:.3f}s, status {response.status_code}')
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    This function exposes the request metrics in the Prometheus text format.
+    """
+    data, content_type = metrics.exposition()
+    return Response(data, content_type=content_type)
+
+
+@app.route('/api/v1/recommender/exclusions/<org_id>', methods=['DELETE'], strict_slashes=False)
+def invalidate_exclusions(org_id):
+    """
+    This function handles DELETE requests dropping the cached owned and not visible data assets of an organization, e.g. when it purchases a data asset.
+    """
+    auth_flag = check_authentication(request.headers)
+    if(debugauth):
+        auth_flag = True
+    if not auth_flag:
+        # status "401 Unauthorized"
+        return jsonify({"message": "ERROR: Unauthorized"}), 401
+    published = exclusion_cache.invalidate(org_id)
+    return jsonify({"org_id": str(org_id), "published": published})
+
+
 # Create a URL route in our application for "/api/v1/recommender/"
 
 
@@ -310,10 +584,68 @@ def recommendation():
             datasets_id = content['datasets_id']
         else:
             datasets_id = []
-        recommendations = generate_recommendations(org_id)
+        if not isinstance(datasets_id, list):
+            # status "400 Bad Request"
+            raise exceptions.ParseError(
+                detail="Request body contains datasets_id that is not a list.")
+        recommendations = generate_recommendations(org_id, datasets_id)
     return jsonify({"recommended_datasets": recommendations})
 
+
+@app.route('/api/v1/recommender/batch/', methods=['POST'], strict_slashes=False)
+def batch_recommendation():
+    """
+    This function handles POST requests for the recommendations of a list of organizations.
+    """
+    content = request.get_json()
+    if content is None:
+        # status "400 Bad Request"
+        raise exceptions.ParseError(detail="Request body is empty.")
+    auth_flag = check_authentication(request.headers)
+    if(debugauth):
+        auth_flag = True
+    if not auth_flag:
+        # status "401 Unauthorized"
+        return jsonify({"message": "ERROR: Unauthorized"}), 401
+    if "org_ids" not in content or not isinstance(content['org_ids'], list):
+        # status "400 Bad Request"
+        raise exceptions.ParseError(
+            detail="Request body does not contain a list of organization IDs.")
+    # deduplicated, in the requested order
+    org_ids = list(dict.fromkeys(str(org_id) for org_id in content['org_ids']))
+    if len(org_ids) > batch_max_orgs:
+        # status "400 Bad Request"
+        raise exceptions.ParseError(
+            detail=f"Request body contains more than {batch_max_orgs} organization IDs.")
+    recommendations = generate_batch_recommendations(org_ids)
+    return jsonify({"recommendations": recommendations})
+
+
+@app.route('/api/v1/recommender/similar/<dataset_id>', methods=['GET'], strict_slashes=False)
+def similar_datasets(dataset_id):
+    """
+    This function handles GET requests for the data assets similar to a given one, among those the organization given by the org_id query parameter can see.
+    """
+    auth_flag = check_authentication(request.headers)
+    if(debugauth):
+        auth_flag = True
+    if not auth_flag:
+        # status "401 Unauthorized"
+        return jsonify({"message": "ERROR: Unauthorized"}), 401
+    org_id = request.args.get("org_id")
+    if not org_id:
+        # status "400 Bad Request"
+        raise exceptions.ParseError(
+            detail="Request does not contain the org_id query parameter.")
+    similar = generate_recommendations_for_dataset_id(dataset_id, org_id)
+    return jsonify({"similar_datasets": similar})
+
+# loaded on import, i.e. once in the gunicorn master before the workers are forked (see gunicorn.conf.py)
+load_artifacts()
+
 if __name__ == "__main__":
+    # development server; in production the API is served by gunicorn, which starts the background tasks in each worker
+    start_background_tasks()
     app.run(host='0.0.0.0', debug=False)  # in production, debug=False
 
 '''
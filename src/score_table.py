@@ -0,0 +1,170 @@
+import os
+import json
+import numpy as np
+
+# An artifact at <path> is stored as:
+#   <path>.scores.npy    float32, a row of scores per row ID
+#   <path>.columns.npy   int32, the column (index into the column IDs) of each score, -1 for padding;
+#                        absent when every row holds a score for every column in order
+#   <path>.defaults.npy  float32, the score of the columns missing from each row, NaN if none
+#   <path>.ids.json      {"rows": [...], "columns": [...]}, written last
+# The .npy files are memory-mapped when read, so a single row is accessed without parsing the rest.
+
+
+def index_path(path):
+    return path + '.ids.json'
+
+
+def _save_array(path, array):
+    # a new file renamed over the old one, so readers holding a mapping of the old one are not affected
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class ScoreTable:
+    """
+    A score matrix with a row per organization (or any row ID) and a column per data asset, possibly keeping only some columns per row.
+    """
+
+    def __init__(self, row_ids, column_ids, scores, columns=None, defaults=None):
+        self.row_ids = row_ids
+        self.column_ids = column_ids
+        self.scores = scores
+        self.columns = columns
+        self.defaults = defaults
+        self.row_index = {str(row_id): n for n, row_id in enumerate(row_ids)}
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], np.zeros((0, 0), dtype=np.float32))
+
+    def __contains__(self, row_id):
+        return str(row_id) in self.row_index
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def row(self, row_id):
+        """
+        return: the columns and the scores of the given row (padding excluded), and its default score; None if the row does not exist
+        """
+        n = self.row_index.get(str(row_id))
+        if n is None:
+            return None
+        scores = self.scores[n]
+        default = None
+        if self.defaults is not None and not np.isnan(self.defaults[n]):
+            default = float(self.defaults[n])
+        if self.columns is None:
+            return np.arange(len(self.column_ids)), scores, default
+        columns = self.columns[n]
+        kept = columns >= 0
+        return columns[kept], scores[kept], default
+
+    def iter_entries(self, row_id, block_size=256):
+        """
+        Walks a row lazily, converting its columns and scores to Python a block at a time, so that reading the first entries does not cost a conversion of the whole row.
+
+        return: an iterator over the [column ID, score] of the given row, in stored order; empty if the row does not exist
+        """
+        row = self.row(row_id)
+        if row is None:
+            return
+        columns, scores, _ = row
+        for start in range(0, len(scores), block_size):
+            for j, s in zip(columns[start:start + block_size].tolist(), scores[start:start + block_size].tolist()):
+                yield [self.column_ids[j], s]
+
+    def entry(self, row_id, limit=None):
+        """
+        param limit: the maximum number of entries returned, all of them if None
+
+        return: a list of [column ID, score] of the given row, in stored order; None if the row does not exist
+        """
+        row = self.row(row_id)
+        if row is None:
+            return None
+        columns, scores, _ = row
+        if limit is not None:
+            columns, scores = columns[:limit], scores[:limit]
+        return [[self.column_ids[j], float(s)] for j, s in zip(columns.tolist(), scores.tolist())]
+
+
+def dense(row_ids, column_ids, scores, top_k=0):
+    """
+    Builds a table from a dense score matrix, keeping only the top_k best scored columns of each row (in descending order) if top_k is set; the dropped columns of a row get the mean of their scores as default.
+
+    param row_ids: a list of row IDs (organizations)
+    param column_ids: a list of column IDs (data assets)
+    param scores: a 2-D array of shape (len(row_ids), len(column_ids))
+    param top_k: the number of columns kept per row; 0 keeps them all
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    n_columns = scores.shape[1] if scores.ndim == 2 else 0
+    if top_k <= 0 or top_k >= n_columns:
+        return ScoreTable(row_ids, column_ids, scores)
+
+    top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    dropped_sum = scores.sum(axis=1, dtype=np.float64) - top_scores.sum(axis=1, dtype=np.float64)
+    defaults = (dropped_sum / (n_columns - top_k)).astype(np.float32)
+    return ScoreTable(row_ids, column_ids, top_scores, top.astype(np.int32), defaults)
+
+
+def ranked(row_ids, column_ids, rankings, defaults=None):
+    """
+    Builds a table from per-row rankings of different lengths.
+
+    param rankings: a list with, for each row, a pair of arrays (columns, scores) in ranked order
+    param defaults: an array with the score of the columns missing from each row (NaN if none), or None
+    """
+    width = max([len(columns) for columns, _ in rankings], default=0)
+    columns = np.full((len(rankings), width), -1, dtype=np.int32)
+    scores = np.full((len(rankings), width), np.nan, dtype=np.float32)
+    for n, (row_columns, row_scores) in enumerate(rankings):
+        columns[n, :len(row_columns)] = row_columns
+        scores[n, :len(row_scores)] = row_scores
+    return ScoreTable(row_ids, column_ids, scores, columns, defaults)
+
+
+def save(path, table):
+    _save_array(path + '.scores.npy', table.scores)
+    for suffix, array in (('.columns.npy', table.columns), ('.defaults.npy', table.defaults)):
+        if array is not None:
+            _save_array(path + suffix, array)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    tmp_path = index_path(path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({"rows": [str(row_id) for row_id in table.row_ids],
+                   "columns": list(table.column_ids)}, f)
+    os.replace(tmp_path, index_path(path))
+
+
+def load(path, mmap_mode='r'):
+    """
+    Reads a table, memory-mapping its arrays.
+
+    param path: the path of the artifact, without suffix
+    """
+    with open(index_path(path)) as f:
+        ids = json.load(f)
+    scores = np.load(path + '.scores.npy', mmap_mode=mmap_mode)
+    columns = defaults = None
+    if os.path.exists(path + '.columns.npy'):
+        columns = np.load(path + '.columns.npy', mmap_mode=mmap_mode)
+    if os.path.exists(path + '.defaults.npy'):
+        defaults = np.load(path + '.defaults.npy', mmap_mode=mmap_mode)
+    return ScoreTable(ids["rows"], ids["columns"], scores, columns, defaults)
+
+
+def load_from_index(ids_path):
+    """
+    Reads a table given the path of its .ids.json file, the file the artifact store watches.
+    """
+    return load(ids_path[:-len('.ids.json')])
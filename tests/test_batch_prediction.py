@@ -0,0 +1,48 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from surprise import Dataset
+from surprise import KNNBaseline
+from surprise import Reader
+
+from models_scoring.batch_prediction import predict_matrix
+
+
+def fitted_model(user_based, k, min_k, seed=0):
+    """
+    Fits a KNNBaseline model as the item and user based models do, on random interactions with scores from 1 to 3.
+    """
+    rng = random.Random(seed)
+    rows = {(f"org{rng.randrange(30)}", f"asset{rng.randrange(40)}"): rng.randint(1, 3) for _ in range(400)}
+    df = pd.DataFrame([(org_id, asset_id, score) for (org_id, asset_id), score in rows.items()],
+                      columns=['org_id', 'asset_id', 'score'])
+    data = Dataset.load_from_df(df, Reader(rating_scale=(1, 3)))
+    algo = KNNBaseline(k=k, min_k=min_k, sim_options={'name': 'cosine', 'user_based': user_based}, verbose=False)
+    algo.fit(data.build_full_trainset())
+    return algo
+
+
+@pytest.mark.parametrize("user_based", [True, False])
+@pytest.mark.parametrize("k, min_k", [(40, 1), (3, 1), (5, 3)])
+def test_predict_matrix_matches_surprise(user_based, k, min_k):
+    algo = fitted_model(user_based, k, min_k)
+    # including organizations and data assets the model was not trained on
+    organizations = [f"org{n}" for n in range(30)] + ["unknown-org"]
+    data_assets = [f"asset{n}" for n in range(40)] + ["unknown-asset"]
+
+    estimates = predict_matrix(algo, organizations, data_assets)
+
+    expected = np.array([[algo.predict(org_id, asset_id).est for asset_id in data_assets]
+                         for org_id in organizations])
+    np.testing.assert_allclose(estimates, expected, rtol=0, atol=1e-9)
+
+
+def test_predict_matrix_unknown_only():
+    algo = fitted_model(user_based=False, k=40, min_k=1)
+
+    estimates = predict_matrix(algo, ["unknown-org"], ["unknown-asset", "asset0"])
+
+    expected = [[algo.predict("unknown-org", "unknown-asset").est, algo.predict("unknown-org", "asset0").est]]
+    np.testing.assert_allclose(estimates, expected, rtol=0, atol=1e-9)
@@ -0,0 +1,41 @@
+import pytest
+
+import artifact_store
+import recommender
+
+
+@pytest.fixture
+def neighbors(monkeypatch):
+    """
+    Replaces the item neighbor table, keyed by data asset IDs as strings as when loaded from JSON.
+    """
+    table = {}
+    monkeypatch.setitem(artifact_store._artifacts["item_neighbors"], "data", table)
+    monkeypatch.setattr(recommender, "contextual_weight", 0.5)
+    return table
+
+
+def test_viewed_integer_ids_are_excluded(neighbors):
+    neighbors.update({"1": [[2, 0.9], [5, 1.0]], "2": [[1, 0.9]]})
+    recommendations = [[1, 0.9], [2, 0.8], [3, 0.7], [4, 0.6], [5, 0.1]]
+
+    ranked = recommender.contextual_recommendations(recommendations, [1])
+
+    assert 1 not in ranked
+    # the neighbors of the viewed data asset are boosted above the other recommendations
+    assert ranked == [2, 5, 3, 4]
+
+
+def test_string_and_integer_ids_are_matched(neighbors):
+    neighbors.update({"1": [["5", 0.8]]})
+    recommendations = [["1", 0.9], ["3", 0.7], ["5", 0.1]]
+
+    ranked = recommender.contextual_recommendations(recommendations, [1])
+
+    assert ranked == ["5", "3"]
+
+
+def test_without_viewed_ids_the_order_is_kept(neighbors):
+    recommendations = [[3, 0.7], [1, 0.5]]
+
+    assert recommender.contextual_recommendations(recommendations, []) == [3, 1]
@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from surprise import Dataset
+from surprise import KNNBaseline
+from surprise import Reader
+from surprise import dump
+
+from models_training import incremental_training
+
+
+def random_interactions(seed=0, n=300):
+    rng = random.Random(seed)
+    rows = {(f"org{rng.randrange(25)}", f"asset{rng.randrange(35)}"): rng.randint(1, 3) for _ in range(n)}
+    return [(org_id, asset_id, score) for (org_id, asset_id), score in rows.items()]
+
+
+def trainset_of(interactions):
+    df = pd.DataFrame(interactions, columns=['org_id', 'asset_id', 'score'])
+    return Dataset.load_from_df(df, Reader(rating_scale=(1, 3))).build_full_trainset()
+
+
+def dumped_model(interactions, sim_options, model_path):
+    algo = KNNBaseline(sim_options=sim_options, verbose=False)
+    algo.fit(trainset_of(interactions))
+    dump.dump(model_path, algo=algo)
+    incremental_training.write_ratings(model_path, algo)
+
+
+def appended(interactions):
+    # a new organization and a new data asset, and new interactions of known ones
+    return interactions + [("org_new", "asset3", 2), ("org1", "asset_new", 3), ("org2", "asset5", 1)]
+
+
+def rescored(interactions):
+    org_id, asset_id, score = interactions[7]
+    return interactions[:7] + [(org_id, asset_id, score % 3 + 1)] + interactions[8:]
+
+
+@pytest.mark.parametrize("user_based", [True, False])
+@pytest.mark.parametrize("change", [appended, rescored])
+def test_incremental_fit_matches_full_fit(tmp_path, monkeypatch, user_based, change):
+    monkeypatch.setattr(incremental_training, "incremental_max_changed_ratio", 1.0)
+    # the incremental update must be taken, not a fit from scratch
+    monkeypatch.setattr(incremental_training, "fit_with_baselines", None)
+    sim_options = {'name': 'cosine', 'user_based': user_based}
+    model_path = str(tmp_path / "model_dump")
+    interactions = random_interactions()
+    dumped_model(interactions, sim_options, model_path)
+
+    trainset = trainset_of(change(interactions))
+    incremental = incremental_training.fit(KNNBaseline(sim_options=sim_options, verbose=False), trainset, model_path)
+    full = KNNBaseline(sim_options=sim_options, verbose=False).fit(trainset)
+
+    np.testing.assert_allclose(incremental.sim, full.sim, atol=1e-12)
+    np.testing.assert_allclose(incremental.bu, full.bu, atol=1e-12)
+    np.testing.assert_allclose(incremental.bi, full.bi, atol=1e-12)
+
+
+def test_previous_model_is_not_loaded_when_too_much_changed(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental_training, "incremental_max_changed_ratio", 0.0)
+    sim_options = {'name': 'cosine', 'user_based': True}
+    model_path = str(tmp_path / "model_dump")
+    interactions = random_interactions()
+    dumped_model(interactions, sim_options, model_path)
+
+    def load(path):
+        raise AssertionError("the previous model was loaded")
+    monkeypatch.setattr(incremental_training.dump, "load", load)
+    trainset = trainset_of(appended(interactions))
+    fitted = incremental_training.fit(KNNBaseline(sim_options=sim_options, verbose=False), trainset, model_path)
+
+    assert fitted.sim.shape == (trainset.n_users, trainset.n_users)
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from models_training import retrieve_data
+
+
+class FakeCursor:
+    """
+    A server-side cursor over a list of (org_id, asset_id, score, watermark) rows, ordered by watermark; the rows
+    sharing a watermark keep their insertion order.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.rows = []
+        self.itersize = None
+
+    def execute(self, query, params=None):
+        rows = sorted(self.table, key=lambda row: row[3])
+        if params:
+            rows = [row for row in rows if row[3] >= int(params[0])]
+        self.rows = rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self, name=None):
+        return FakeCursor(self.table)
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setattr(retrieve_data, "interaction_table", "interactions")
+    monkeypatch.setattr(retrieve_data, "watermark_column", "updated")
+    monkeypatch.setattr(retrieve_data, "interaction_watermark_overlap", 3)
+    monkeypatch.setattr(retrieve_data, "interaction_batch_size", 2)
+    return []
+
+
+def fetch(table, watermark):
+    columns, watermark = retrieve_data.fetch_interactions(FakeConnection(table), watermark)
+    rows = list(zip(columns["org_id"].tolist(), columns["asset_id"].tolist(), columns["score"].tolist()))
+    # stored as JSON in Redis
+    return rows, json.loads(json.dumps(watermark))
+
+
+def test_full_extraction_reads_every_row(table):
+    table += [(n, 10, 1.0, n) for n in range(1, 6)]
+
+    rows, watermark = fetch(table, None)
+
+    assert rows == [(n, 10, 1.0) for n in range(1, 6)]
+    assert watermark["start"] == "3"
+    assert len(watermark["tail"]) == 3
+
+
+def test_empty_delta(table):
+    table += [(n, 10, 1.0, n) for n in range(1, 6)]
+    _, watermark = fetch(table, None)
+
+    rows, next_watermark = fetch(table, watermark)
+
+    assert rows == []
+    assert next_watermark == watermark
+
+
+def test_late_row_within_the_overlap_is_extracted(table):
+    table += [(n, 10, 1.0, n) for n in range(1, 6)]
+    _, watermark = fetch(table, None)
+
+    # committed after the extraction, with a watermark among those of the tail
+    table += [(6, 10, 2.0, 4), (7, 10, 3.0, 6)]
+    rows, _ = fetch(table, watermark)
+
+    assert rows == [(6, 10, 2.0), (7, 10, 3.0)]
+
+
+def test_ties_beyond_the_overlap_are_counted(table):
+    table += [(n, 10, 1.0, 5) for n in range(10)]
+    rows, watermark = fetch(table, None)
+    assert len(rows) == 10
+    # only the tail rows are stored, the ties before them are counted
+    assert watermark["skip"] == 7
+    assert len(watermark["tail"]) == 3
+
+    rows, watermark = fetch(table, watermark)
+    assert rows == []
+
+    table += [(10, 10, 1.0, 5), (11, 10, 1.0, 6)]
+    rows, watermark = fetch(table, watermark)
+    assert rows == [(10, 10, 1.0), (11, 10, 1.0)]
+    assert watermark["start"] == "5"
+    assert watermark["skip"] == 9
+
+
+def test_identical_rows_are_all_extracted(table):
+    table += [(1, 10, 1.0, 1), (1, 10, 1.0, 1)]
+    _, watermark = fetch(table, None)
+
+    table += [(1, 10, 1.0, 1)]
+    rows, _ = fetch(table, watermark)
+
+    assert rows == [(1, 10, 1.0)]
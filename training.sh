@@ -2,10 +2,8 @@
 
 PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin:/usr/local/games:/usr/games
 SHELL=/bin/bash
+# lets the stages import the shared modules under src/
+export PYTHONPATH=/code/src
 
 echo "Training.sh Started running"
-python /code/src/models_training/retrieve_data.py
-python /code/src/models_scoring/semantic_scoring.py
-python /code/src/models_training/item_based_model.py && python /code/src/models_scoring/item_based_scoring.py
-python /code/src/models_training/user_based_model.py && python /code/src/models_scoring/user_based_scoring.py
-python /code/src/hybrid_recommendations.py
\ No newline at end of file
+python /code/src/pipeline.py
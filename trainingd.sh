@@ -2,9 +2,8 @@
 
 PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin:/usr/local/games:/usr/games
 SHELL=/bin/bash
+# lets the stages import the shared modules under src/
+export PYTHONPATH=./src
 
 echo "Training.sh Started running"
-python ./src/models_scoring/semantic_scoring.py
-python ./src/models_training/item_based_model.py && python ./src/models_scoring/item_based_scoring.py
-python ./src/models_training/user_based_model.py && python ./src/models_scoring/user_based_scoring.py
-python ./src/hybrid_recommendations.py
+python ./src/pipeline.py --stages semantic_scoring,cf_models,item_based_scoring,user_based_scoring,hybrid_recommendations